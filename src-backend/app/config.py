@@ -1,5 +1,6 @@
 from functools import lru_cache
 from pathlib import Path
+from typing import Literal
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -28,6 +29,21 @@ class Settings(BaseSettings):
     qdrant_url: str
     qdrant_api_key: str
     qdrant_collection_name: str = "Xuan_documents"
+    # Transport: REST by default, gRPC on qdrant_grpc_port when prefer_grpc is set
+    qdrant_prefer_grpc: bool = False
+    qdrant_grpc_port: int = 6334
+    qdrant_timeout: int = 10
+    # Max pooled HTTP connections per client (None = httpx default)
+    qdrant_pool_size: int | None = 32
+
+    # Retrieval: "dense", or "hybrid" to fuse dense and BM25-style sparse
+    # vectors with reciprocal-rank fusion. Hybrid needs a collection created
+    # in hybrid mode, so point QDRANT_COLLECTION_NAME at a new collection and
+    # re-ingest when switching.
+    retrieval_mode: Literal["dense", "hybrid"] = "dense"
+    # Candidates fetched from each of the dense and sparse lists before fusion
+    hybrid_candidate_k: int = 20
+    rrf_k: int = 60
 
     # LLM
     llm_api_base: str
@@ -36,17 +52,81 @@ class Settings(BaseSettings):
     llm_context_window: int = 8192
     llm_max_tokens: int = 2048
     llm_temperature: float = 0.7
+    # Process-wide LLM admission control: concurrent calls, calls allowed to
+    # wait for a slot, and seconds a call may wait before it is shed with a 503
+    llm_max_concurrency: int = 8
+    llm_max_queue: int = 64
+    llm_queue_timeout: float = 30.0
+    # Identical concurrent LLM calls (same model, messages and sampling settings) share one completion
+    llm_coalesce_enabled: bool = True
+
+    # Context packing for /query: retrieved passages are merged, deduplicated
+    # and MMR-ordered into what is left of the context window after the prompt
+    # and llm_max_tokens; a non-zero budget caps it further
+    context_token_budget: int = 0
+    context_mmr_lambda: float = 0.7
+    context_dedup_threshold: float = 0.9
 
     # Embedding (can use separate API base and key)
     embedding_api_base: str | None = None
     embedding_api_key: str | None = None
     embedding_model_name: str = "text-embedding-3-small"
 
+    # Query-embedding cache (in-process LRU + SQLite file shared by workers)
+    embedding_cache_size: int = 2048
+    embedding_cache_path: str | None = "./data/cache/embeddings.sqlite3"
+    embedding_cache_max_entries: int = 100_000
+
     # Ingestion
     documents_path: str = "./data/documents"
     chunk_size: int = 512
     chunk_overlap: int = 50
+    ingest_manifest_dir: str = "./data/manifests"
+    # Ingestion pipeline: parse processes (0 = parse in-process), embedding
+    # batch size and concurrent embedding requests, Qdrant upsert batch size
+    ingest_parse_workers: int = 4
+    ingest_embed_batch_size: int = 64
+    ingest_embed_concurrency: int = 4
+    ingest_upsert_batch_size: int = 256
+    # Files streamed through the pipeline per window; the manifest is saved after each
+    ingest_window_size: int = 32
+    # Background ingestion jobs: status and lock files, and concurrent jobs per
+    # process (one per collection). Jobs run on threads in the server process.
+    ingest_job_dir: str = "./data/jobs"
+    ingest_job_workers: int = 2
+
+    # Semantic answer cache for /query (opt-in)
+    semantic_cache_enabled: bool = False
+    semantic_cache_max_distance: float = 0.05
+    semantic_cache_ttl_seconds: float = 3600
+    semantic_cache_max_entries: int = 1000
+
+    # Concurrency
+    blocking_pool_size: int = 8
+
+    # Request tracing: the spans of the last trace_buffer_size traces are kept
+    # for /debug/traces and appended to a JSON-lines file (empty path disables),
+    # rotated at trace_export_max_bytes keeping trace_export_backups old files
+    tracing_enabled: bool = True
+    trace_export_path: str | None = "./data/traces/spans.jsonl"
+    trace_export_max_bytes: int = 50 * 1024 * 1024
+    trace_export_backups: int = 3
+    trace_buffer_size: int = 200
+
+    # Background health monitor: seconds between probes and per-probe timeout
+    health_check_interval: float = 15.0
+    health_probe_timeout: float = 5.0
 
+    # Ziwei knowledge base
+    ziwei_search_cache_size: int = 1024
+    # Passages are cut to ziwei_snippet_chars characters around keyword hits,
+    # widening each hit by ziwei_snippet_window characters (0 = full text)
+    ziwei_snippet_chars: int = 600
+    ziwei_snippet_window: int = 60
+    # Palace analyses keyed by a hash of prompt, model and temperature (empty path disables)
+    palace_report_cache_path: str | None = "./data/cache/palace_reports.sqlite3"
+    palace_report_cache_max_entries: int = 10_000
+    palace_report_cache_ttl_seconds: float | None = 7 * 24 * 3600
 
 
 @lru_cache
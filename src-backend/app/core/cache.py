@@ -0,0 +1,178 @@
+"""Caching helpers shared by services."""
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+from pathlib import Path
+from typing import Any
+
+
+class LRUCache:
+    """
+    Thread-safe bounded LRU cache with hit/miss counters.
+    A maxsize of 0 disables caching.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any | None:
+        """Return the cached value, or None on a miss."""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop all entries; counters are kept."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class SQLiteCache:
+    """
+    Disk-backed key/value cache shared by all worker processes on a host.
+
+    Entries expire after ttl_seconds (None keeps them forever) and the least
+    recently used ones are evicted beyond max_entries. WAL mode lets several
+    processes read and write the same file concurrently.
+
+    Reads never write: access times of hits are kept in memory and flushed
+    with the next put, which is also the only time eviction looks at them.
+    All methods block on disk, so async callers should use run_blocking.
+    """
+
+    def __init__(self, path: str | Path, max_entries: int, ttl_seconds: float | None = None):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+        self._conn.commit()
+        self._writes_since_prune = 0
+        self._pending_access: dict[str, float] = {}
+
+    def get(self, key: str) -> bytes | None:
+        """Return the cached value, or None on a miss or an expired entry."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (
+                self.ttl_seconds is not None and now - row[1] > self.ttl_seconds
+            ):
+                self.misses += 1
+                return None
+            # Best effort: bounded so a read-only workload cannot grow it forever
+            if len(self._pending_access) < self.max_entries:
+                self._pending_access[key] = now
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, value: bytes) -> None:
+        if self.max_entries <= 0:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            self._pending_access.pop(key, None)
+            self._flush_access()
+            self._writes_since_prune += 1
+            # Pruning scans the table, so it is amortized over many writes
+            if self._writes_since_prune >= max(1, self.max_entries // 10):
+                self._prune(now)
+            self._conn.commit()
+
+    def _flush_access(self) -> None:
+        """Write buffered access times; the caller commits."""
+        if self._pending_access:
+            self._conn.executemany(
+                "UPDATE entries SET accessed_at = MAX(accessed_at, ?) WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in self._pending_access.items()],
+            )
+            self._pending_access.clear()
+
+    def _prune(self, now: float) -> None:
+        self._writes_since_prune = 0
+        if self.ttl_seconds is not None:
+            self._conn.execute("DELETE FROM entries WHERE created_at < ?", (now - self.ttl_seconds,))
+        self._conn.execute(
+            """
+            DELETE FROM entries WHERE key IN (
+                SELECT key FROM entries ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (self.max_entries,),
+        )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+            self._pending_access.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,40 @@
+"""Helpers for keeping blocking calls off the event loop."""
+
+import asyncio
+import contextvars
+import functools
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, TypeVar
+
+from app.config import get_settings
+
+T = TypeVar("T")
+
+
+@lru_cache
+def get_blocking_executor() -> ThreadPoolExecutor:
+    """Bounded thread pool for library calls that have no async variant."""
+    settings = get_settings()
+    return ThreadPoolExecutor(
+        max_workers=settings.blocking_pool_size,
+        thread_name_prefix="blocking",
+    )
+
+
+async def run_blocking(func: Callable[..., T], /, *args: Any, **kwargs: Any) -> T:
+    """Run a blocking callable in the bounded pool and await its result."""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    return await loop.run_in_executor(get_blocking_executor(), call)
+
+
+def has_native_async(obj: Any, method: str, base: type) -> bool:
+    """
+    Whether obj's class overrides base.method.
+    Library base classes often implement the async variant by calling the
+    sync one, which would still block the event loop.
+    """
+    return getattr(type(obj), method, None) is not getattr(base, method, None)
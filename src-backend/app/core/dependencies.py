@@ -1,9 +1,12 @@
 from functools import lru_cache
 
 from app.config import Settings, get_settings
+from app.services.health_service import HealthMonitor
+from app.services.ingestion_jobs import IngestionJobManager
 from app.services.ingestion_service import IngestionService
 from app.services.llm_service import LLMService
 from app.services.rag_service import RAGService
+from app.services.report_cache import PalaceReportCache
 from app.services.ziwei_rag import ZiweiRAGService
 
 
@@ -21,6 +24,18 @@ def get_ingestion_service() -> IngestionService:
     return IngestionService(settings)
 
 
+@lru_cache
+def get_ingestion_job_manager() -> IngestionJobManager:
+    settings = get_settings()
+    return IngestionJobManager(settings, get_ingestion_service())
+
+
+@lru_cache
+def get_health_monitor() -> HealthMonitor:
+    settings = get_settings()
+    return HealthMonitor(settings, get_ingestion_service())
+
+
 @lru_cache
 def get_rag_service() -> RAGService:
     settings = get_settings()
@@ -33,5 +48,21 @@ def get_rag_service() -> RAGService:
 
 @lru_cache
 def get_ziwei_rag_service() -> ZiweiRAGService:
-    return ZiweiRAGService()
+    settings = get_settings()
+    return ZiweiRAGService(
+        cache_size=settings.ziwei_search_cache_size,
+        snippet_chars=settings.ziwei_snippet_chars,
+        snippet_window=settings.ziwei_snippet_window,
+    )
+
 
+@lru_cache
+def get_palace_report_cache() -> PalaceReportCache | None:
+    settings = get_settings()
+    if not settings.palace_report_cache_path:
+        return None
+    return PalaceReportCache(
+        settings.palace_report_cache_path,
+        max_entries=settings.palace_report_cache_max_entries,
+        ttl_seconds=settings.palace_report_cache_ttl_seconds,
+    )
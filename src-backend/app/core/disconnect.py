@@ -0,0 +1,82 @@
+"""Event-driven client disconnect detection for long-running endpoints."""
+
+import asyncio
+import contextlib
+import logging
+from collections.abc import Awaitable
+from typing import TypeVar
+
+from starlette.requests import Request
+
+from app.core.metrics import CANCELLATIONS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class ClientDisconnected(Exception):
+    """Raised when work was cancelled because the client went away."""
+
+
+class DisconnectWatcher:
+    """
+    Cancels watched tasks as soon as the client disconnects.
+
+    A single task waits on the ASGI receive channel for http.disconnect, so a
+    request costs no wakeups until the client actually leaves. Must be used
+    after the request body has been read, which FastAPI does before calling
+    the endpoint.
+
+        async with DisconnectWatcher(request) as watcher:
+            result = await watcher.run(do_work())
+    """
+
+    def __init__(self, request: Request):
+        self._request = request
+        self._tasks: set[asyncio.Future] = set()
+        self._listener: asyncio.Task | None = None
+        self.disconnected = False
+
+    async def __aenter__(self) -> "DisconnectWatcher":
+        self._listener = asyncio.create_task(self._listen())
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self._listener.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._listener
+
+    async def _listen(self) -> None:
+        while True:
+            message = await self._request.receive()
+            if message["type"] == "http.disconnect":
+                break
+        self.disconnected = True
+        CANCELLATIONS.inc(stage="client_disconnect")
+        logger.info(f"Client disconnected from {self._request.url.path}, cancelling {len(self._tasks)} tasks")
+        for task in self._tasks:
+            task.cancel()
+
+    def watch(self, *tasks: asyncio.Future) -> None:
+        """Cancel tasks when the client disconnects; cancels at once if it already has."""
+        self._tasks.update(tasks)
+        if self.disconnected:
+            for task in tasks:
+                task.cancel()
+
+    async def run(self, awaitable: Awaitable[T]) -> T:
+        """
+        Await awaitable as a watched task.
+        Raises ClientDisconnected if it was cancelled by a disconnect.
+        """
+        task = asyncio.ensure_future(awaitable)
+        self.watch(task)
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if self.disconnected:
+                raise ClientDisconnected(self._request.url.path) from None
+            raise
+        finally:
+            self._tasks.discard(task)
@@ -0,0 +1,227 @@
+"""
+In-process metrics registry, exposed in Prometheus text format at /metrics.
+
+Recording is a dict lookup and a few integer adds under a lock; nothing is
+formatted until the endpoint is scraped, so an unscraped registry costs
+next to nothing.
+"""
+
+import bisect
+import math
+import threading
+import time
+from collections.abc import Iterator
+
+# Upper bounds (seconds) for latency histograms, from a cache hit to a long completion
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Upper bounds for generation speed in tokens per second
+RATE_BUCKETS = (1.0, 5.0, 10.0, 20.0, 30.0, 50.0, 75.0, 100.0, 150.0, 250.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return "+Inf" if math.isinf(value) else repr(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            *self._samples(),
+        ]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, one series per label combination."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> Iterator[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class _Timer:
+    """Observes the elapsed time of a with-block into a histogram."""
+
+    __slots__ = ("_histogram", "_labels", "_start")
+
+    def __init__(self, histogram: "Histogram", labels: dict[str, str]):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self) -> "_Timer":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._histogram.observe(time.perf_counter() - self._start, **self._labels)
+
+
+class Histogram(_Metric):
+    """Bucketed distribution of observed values, one series per label combination."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per series: non-cumulative bucket counts (last slot is +Inf), sum
+        self._series: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    def time(self, **labels: str) -> _Timer:
+        """Context manager that observes the duration of its block in seconds."""
+        return _Timer(self, labels)
+
+    def count(self, **labels: str) -> int:
+        series = self._series.get(self._key(labels))
+        return sum(series[0]) if series else 0
+
+    def _samples(self) -> Iterator[str]:
+        with self._lock:
+            snapshot = sorted((key, list(counts), total[0]) for key, (counts, total) in self._series.items())
+        for key, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class MetricsRegistry:
+    """Holds metrics and renders them in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "xuan_stage_duration_seconds",
+    "Duration of pipeline stages.",
+    ("stage",),
+)
+LLM_TIME_TO_FIRST_TOKEN_SECONDS = REGISTRY.histogram(
+    "xuan_llm_time_to_first_token_seconds",
+    "Time from sending a streamed LLM request to its first token.",
+)
+LLM_COMPLETION_SECONDS = REGISTRY.histogram(
+    "xuan_llm_completion_seconds",
+    "Total duration of upstream LLM completions.",
+    ("mode",),
+)
+LLM_TOKENS_PER_SECOND = REGISTRY.histogram(
+    "xuan_llm_tokens_per_second",
+    "Completion tokens generated per second.",
+    ("mode",),
+    buckets=RATE_BUCKETS,
+)
+LLM_COMPLETION_TOKENS = REGISTRY.counter(
+    "xuan_llm_completion_tokens_total",
+    "Completion tokens generated by upstream LLM calls.",
+    ("mode",),
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "xuan_cache_requests_total",
+    "Cache lookups by cache and result (hit or miss).",
+    ("cache", "result"),
+)
+ERRORS = REGISTRY.counter(
+    "xuan_errors_total",
+    "Failed operations by stage.",
+    ("stage",),
+)
+CANCELLATIONS = REGISTRY.counter(
+    "xuan_cancellations_total",
+    "Operations cancelled, mostly by client disconnects, by stage.",
+    ("stage",),
+)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
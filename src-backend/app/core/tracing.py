@@ -0,0 +1,334 @@
+"""
+Lightweight request tracing.
+
+Every HTTP request gets a trace ID, and code marks interesting work with
+spans. The current span lives in a context variable, so spans opened in
+tasks and worker threads started from a request nest under it. Finished
+spans go to pluggable exporters: an in-memory ring buffer for
+/debug/traces and, by default, a JSON-lines file, so tracing works offline.
+"""
+
+import asyncio
+import functools
+import inspect
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Protocol
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+TRACE_HEADER = "x-trace-id"
+# Requests to these paths are not traced
+UNTRACED_PATH_PREFIXES = ("/metrics", "/debug/", "/docs", "/redoc", "/openapi.json")
+# Health probes poll these every few seconds and would evict real traces from the buffer
+UNTRACED_PATHS = frozenset({"/", "/health"})
+
+_current_span: ContextVar["Span | None"] = ContextVar("current_span", default=None)
+
+
+def _new_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+@dataclass
+class Span:
+    """A timed unit of work within a trace."""
+
+    name: str
+    trace_id: str
+    span_id: str = field(default_factory=_new_id)
+    parent_id: str | None = None
+    start_time: float = field(default_factory=time.time)
+    duration_ms: float | None = None
+    status: str = "ok"
+    error: str | None = None
+    attributes: dict[str, Any] = field(default_factory=dict)
+    _start: float = field(default_factory=time.perf_counter, repr=False)
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict[str, Any]:
+        data = asdict(self)
+        del data["_start"]
+        return data
+
+
+class SpanExporter(Protocol):
+    """Receives every finished span."""
+
+    def export(self, span: Span) -> None: ...
+
+    def shutdown(self) -> None: ...
+
+
+class RingBufferExporter:
+    """Keeps the spans of the most recent max_traces traces in memory."""
+
+    def __init__(self, max_traces: int):
+        self.max_traces = max_traces
+        self._traces: OrderedDict[str, list[Span]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            spans = self._traces.get(span.trace_id)
+            if spans is None:
+                spans = self._traces[span.trace_id] = []
+                while len(self._traces) > self.max_traces:
+                    self._traces.popitem(last=False)
+            spans.append(span)
+
+    def get(self, trace_id: str) -> list[Span] | None:
+        with self._lock:
+            spans = self._traces.get(trace_id)
+            return sorted(spans, key=lambda s: s.start_time) if spans is not None else None
+
+    def recent(self, limit: int) -> list[tuple[str, list[Span]]]:
+        """Return up to limit traces, newest first."""
+        with self._lock:
+            items = list(self._traces.items())[-limit:]
+        return [(trace_id, list(spans)) for trace_id, spans in reversed(items)]
+
+    def shutdown(self) -> None:
+        pass
+
+
+class JSONLinesExporter:
+    """
+    Appends one JSON object per span to a file, written by a background thread.
+    Once the file reaches max_bytes it is rotated to path.1, path.2, ... and
+    only the newest `backups` rotated files are kept.
+    """
+
+    def __init__(self, path: str | Path, max_bytes: int = 0, backups: int = 0):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._queue: queue.SimpleQueue[Span | None] = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._write, name="trace-export", daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span) -> None:
+        self._queue.put(span)
+
+    def _rotate(self) -> None:
+        for index in range(self.backups - 1, 0, -1):
+            source = self.path.with_name(f"{self.path.name}.{index}")
+            if source.exists():
+                source.replace(self.path.with_name(f"{self.path.name}.{index + 1}"))
+        if self.backups > 0:
+            self.path.replace(self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink(missing_ok=True)
+
+    def _write(self) -> None:
+        f = self.path.open("a", encoding="utf-8")
+        try:
+            while (span := self._queue.get()) is not None:
+                f.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+                if self._queue.empty():
+                    f.flush()
+                if self.max_bytes > 0 and f.tell() >= self.max_bytes:
+                    f.close()
+                    self._rotate()
+                    f = self.path.open("a", encoding="utf-8")
+        finally:
+            f.close()
+
+    def shutdown(self) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+
+class _NoopSpan(Span):
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, **attributes: Any) -> None:
+        pass
+
+
+class Tracer:
+    """Creates spans and hands finished ones to the exporters."""
+
+    def __init__(self, enabled: bool = True, exporters: list[SpanExporter] | None = None):
+        self.enabled = enabled
+        self.exporters: list[SpanExporter] = list(exporters or [])
+
+    def add_exporter(self, exporter: SpanExporter) -> None:
+        self.exporters.append(exporter)
+
+    def start_span(self, name: str, trace_id: str | None = None, **attributes: Any) -> Span:
+        """
+        Start a span under the current span without making it current.
+        Use for work that outlives a with-block, such as async generators.
+        """
+        if not self.enabled:
+            return _NoopSpan(name=name, trace_id="")
+        parent = _current_span.get()
+        if trace_id is None:
+            trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        return Span(
+            name=name,
+            trace_id=trace_id,
+            parent_id=parent.span_id if parent is not None and parent.trace_id == trace_id else None,
+            attributes=attributes,
+        )
+
+    def end_span(self, span: Span, error: BaseException | None = None) -> None:
+        if isinstance(span, _NoopSpan):
+            return
+        span.duration_ms = 1000 * (time.perf_counter() - span._start)
+        if isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+            span.status = "cancelled"
+        elif error is not None:
+            span.status = "error"
+            span.error = str(error) or type(error).__name__
+        for exporter in self.exporters:
+            try:
+                exporter.export(span)
+            except Exception:
+                logger.exception(f"Span export failed in {type(exporter).__name__}")
+
+    @contextmanager
+    def span(self, name: str, trace_id: str | None = None, **attributes: Any) -> Iterator[Span]:
+        """Run a block as the current span."""
+        span = self.start_span(name, trace_id, **attributes)
+        token = _current_span.set(span) if self.enabled else None
+        try:
+            yield span
+        except BaseException as e:
+            self.end_span(span, e)
+            raise
+        else:
+            self.end_span(span)
+        finally:
+            if token is not None:
+                _current_span.reset(token)
+
+    def shutdown(self) -> None:
+        for exporter in self.exporters:
+            exporter.shutdown()
+
+
+@lru_cache
+def get_trace_buffer() -> RingBufferExporter:
+    return RingBufferExporter(get_settings().trace_buffer_size)
+
+
+@lru_cache
+def get_tracer() -> Tracer:
+    """Process-wide tracer: ring buffer always, JSON-lines file when trace_export_path is set."""
+    settings = get_settings()
+    exporters: list[SpanExporter] = [get_trace_buffer()]
+    if settings.tracing_enabled and settings.trace_export_path:
+        exporters.append(
+            JSONLinesExporter(
+                settings.trace_export_path,
+                max_bytes=settings.trace_export_max_bytes,
+                backups=settings.trace_export_backups,
+            )
+        )
+    return Tracer(enabled=settings.tracing_enabled, exporters=exporters)
+
+
+def span(name: str, **attributes: Any):
+    """Run a block as a span of the current trace (or of a new trace outside requests)."""
+    return get_tracer().span(name, **attributes)
+
+
+def traced(name: str) -> Callable[[Callable], Callable]:
+    """Decorator running each call of a sync or async function as a span."""
+
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def current_span() -> Span | None:
+    return _current_span.get()
+
+
+def set_span_attributes(**attributes: Any) -> None:
+    """Add attributes to the current span, if any."""
+    span = _current_span.get()
+    if span is not None:
+        span.set_attributes(**attributes)
+
+
+def current_trace_id() -> str | None:
+    span = _current_span.get()
+    return span.trace_id if span is not None else None
+
+
+def _valid_trace_id(value: str) -> bool:
+    return 0 < len(value) <= 64 and all(c in "0123456789abcdefABCDEF-" for c in value)
+
+
+class TracingMiddleware:
+    """
+    Opens a root span per HTTP request and returns its ID in the X-Trace-Id
+    header. A valid incoming X-Trace-Id is reused, so callers can correlate.
+    Pure ASGI, so the request's receive channel is passed through untouched.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        path = scope.get("path", "")
+        if scope["type"] != "http" or path in UNTRACED_PATHS or path.startswith(UNTRACED_PATH_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope["headers"]).get(TRACE_HEADER.encode(), b"").decode("latin-1")
+        trace_id = incoming if _valid_trace_id(incoming) else uuid.uuid4().hex
+        method = scope.get("method", "")
+
+        with get_tracer().span(f"{method} {path}", trace_id=trace_id, method=method, path=path) as root:
+
+            async def send_with_trace_id(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    root.set_attribute("status_code", message["status"])
+                    message["headers"] = [
+                        *message.get("headers", []),
+                        (TRACE_HEADER.encode(), trace_id.encode()),
+                    ]
+                await send(message)
+
+            await self.app(scope, receive, send_with_trace_id)
@@ -14,6 +14,10 @@ class QueryRequest(BaseModel):
     top_k: int = Field(
         default=5, ge=1, le=20, description="Number of documents to retrieve"
     )
+    bypass_cache: bool = Field(
+        default=False,
+        description="Skip the semantic answer cache and always generate a fresh answer",
+    )
 
 
 class IngestRequest(BaseModel):
@@ -80,6 +84,21 @@ class AstrolabeSubmitRequest(BaseModel):
         description="Birth info used to generate the astrolabe",
     )
     astrolabe: dict = Field(..., description="Computed astrolabe payload")
+    full_text: bool = Field(
+        default=False,
+        alias="fullText",
+        description="Embed whole ancient-text passages instead of keyword snippets",
+    )
+    bypass_cache: bool = Field(
+        default=False,
+        alias="bypassCache",
+        description="Skip the palace report cache and always generate fresh analyses",
+    )
+    stream_tokens: bool = Field(
+        default=False,
+        alias="streamTokens",
+        description="Also emit token events while palaces are generated (streaming endpoint)",
+    )
 
 
 class MeiwenCastRequest(BaseModel):
@@ -1,4 +1,5 @@
 from datetime import datetime
+from typing import Any
 
 from pydantic import BaseModel
 
@@ -15,16 +16,106 @@ class IngestResponse(BaseModel):
 
     status: str
     documents_processed: int
+    documents_added: int = 0
+    documents_updated: int = 0
+    documents_skipped: int = 0
+    documents_deleted: int = 0
+    chunks_embedded: int = 0
+    documents_per_second: float = 0.0
+    chunks_per_second: float = 0.0
+    vectors_per_second: float = 0.0
     collection_name: str
     timestamp: datetime
 
 
+class IngestJobResponse(BaseModel):
+    """Response model for background ingestion jobs."""
+
+    job_id: str
+    status: str
+    collection_name: str
+    directory_path: str | None = None
+    created_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    files_total: int = 0
+    files_done: int = 0
+    documents_added: int = 0
+    documents_updated: int = 0
+    documents_skipped: int = 0
+    documents_deleted: int = 0
+    chunks_embedded: int = 0
+    eta_seconds: float | None = None
+    error: str | None = None
+
+
+class DependencyHealth(BaseModel):
+    """Latest probe result for one external dependency."""
+
+    ok: bool
+    latency_ms: float
+    checked_at: datetime
+    error: str | None = None
+
+
+class LLMQueueStats(BaseModel):
+    """Load on the process-wide LLM scheduler."""
+
+    max_concurrency: int
+    max_queue: int
+    in_flight: int
+    queued: int
+    admitted: int
+    rejected: int
+    timed_out: int
+    avg_wait_ms: float
+    p95_wait_ms: float
+    max_wait_ms: float
+    coalesced: int = 0
+
+
 class HealthResponse(BaseModel):
     """Health check response."""
 
     status: str
     qdrant_connected: bool
     llm_configured: bool
+    checked_at: datetime | None = None
+    dependencies: dict[str, DependencyHealth] | None = None
+    llm_queue: LLMQueueStats | None = None
+
+
+class SpanResponse(BaseModel):
+    """One finished tracing span."""
+
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: str | None = None
+    start_time: datetime
+    duration_ms: float
+    status: str
+    error: str | None = None
+    attributes: dict[str, Any] = {}
+
+
+class TraceResponse(BaseModel):
+    """All spans recorded for one trace, in start order."""
+
+    trace_id: str
+    duration_ms: float
+    spans: list[SpanResponse]
+
+
+class TraceSummary(BaseModel):
+    """Root span of a recent trace."""
+
+    trace_id: str
+    name: str
+    start_time: datetime
+    duration_ms: float
+    status: str
+    spans: int
 
 
 class AstrolabeResponse(BaseModel):
@@ -40,12 +131,15 @@ class PalaceReport(BaseModel):
     name: str
     index: int
     analysis: str
+    cache_hit: bool = False
 
 
 class PalaceAnalysisResponse(BaseModel):
     """Response model for palace analysis with 12 palace reports."""
 
     palaces: list[PalaceReport]
+    cache_hits: int = 0
+    cache_misses: int = 0
 
 
 class MeiwenAIAnalysis(BaseModel):
@@ -0,0 +1,62 @@
+from datetime import datetime, timezone
+
+from fastapi import APIRouter, HTTPException, Query
+
+from app.core.tracing import Span, get_trace_buffer
+from app.models.responses import SpanResponse, TraceResponse, TraceSummary
+
+router = APIRouter(prefix="/debug", tags=["Debug"])
+
+
+def _timestamp(epoch: float) -> datetime:
+    return datetime.fromtimestamp(epoch, timezone.utc)
+
+
+def _root(spans: list[Span]) -> Span:
+    """The request span, or the earliest span while the request is still running."""
+    roots = [span for span in spans if span.parent_id is None]
+    return min(roots or spans, key=lambda span: span.start_time)
+
+
+def _duration_ms(spans: list[Span]) -> float:
+    start = min(span.start_time for span in spans)
+    end = max(span.start_time + span.duration_ms / 1000 for span in spans)
+    return 1000 * (end - start)
+
+
+@router.get("/traces", response_model=list[TraceSummary])
+async def list_traces(limit: int = Query(20, ge=1, le=200)):
+    """List the most recent traces, newest first."""
+    summaries = []
+    for trace_id, spans in get_trace_buffer().recent(limit):
+        root = _root(spans)
+        summaries.append(
+            TraceSummary(
+                trace_id=trace_id,
+                name=root.name,
+                start_time=_timestamp(root.start_time),
+                duration_ms=_duration_ms(spans),
+                status=root.status,
+                spans=len(spans),
+            )
+        )
+    return summaries
+
+
+@router.get("/traces/{trace_id}", response_model=TraceResponse)
+async def get_trace(trace_id: str):
+    """
+    Return every finished span of a recent trace, in start order.
+    The trace ID is returned to clients in the X-Trace-Id response header.
+    """
+    spans = get_trace_buffer().get(trace_id)
+    if not spans:
+        raise HTTPException(status_code=404, detail=f"Trace not found: {trace_id}")
+    return TraceResponse(
+        trace_id=trace_id,
+        duration_ms=_duration_ms(spans),
+        spans=[
+            SpanResponse(**{**span.to_dict(), "start_time": _timestamp(span.start_time)})
+            for span in spans
+        ],
+    )
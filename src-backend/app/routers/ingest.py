@@ -1,12 +1,13 @@
 from datetime import datetime, timezone
 
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 
 from app.config import get_settings
-from app.core.dependencies import get_ingestion_service
+from app.core.concurrency import run_blocking
+from app.core.dependencies import get_ingestion_job_manager
 from app.models.requests import IngestRequest
-from app.models.responses import IngestResponse
-from app.services.ingestion_service import IngestionService
+from app.models.responses import IngestJobResponse, IngestResponse
+from app.services.ingestion_jobs import IngestionJobConflict, IngestionJobManager, IngestJob
 
 router = APIRouter(prefix="/ingest", tags=["Ingestion"])
 
@@ -14,48 +15,107 @@ router = APIRouter(prefix="/ingest", tags=["Ingestion"])
 @router.post("/", response_model=IngestResponse)
 async def ingest_documents(
     request: IngestRequest,
-    ingestion_service: IngestionService = Depends(get_ingestion_service),
+    job_manager: IngestionJobManager = Depends(get_ingestion_job_manager),
 ):
     """
     Ingest documents from the specified directory.
     Loads, chunks, embeds, and stores documents in Qdrant.
+    Returns 409 while another ingestion of the collection is running.
     """
     try:
-        count = ingestion_service.ingest_documents(
+        stats = await run_blocking(
+            job_manager.ingest,
             directory_path=request.directory_path,
-            extensions=request.file_extensions,
+            file_extensions=request.file_extensions,
         )
 
         settings = get_settings()
         return IngestResponse(
             status="success",
-            documents_processed=count,
+            documents_processed=stats.processed,
+            documents_added=stats.added,
+            documents_updated=stats.updated,
+            documents_skipped=stats.skipped,
+            documents_deleted=stats.deleted,
+            chunks_embedded=stats.chunks,
+            documents_per_second=stats.documents_per_second,
+            chunks_per_second=stats.chunks_per_second,
+            vectors_per_second=stats.vectors_per_second,
             collection_name=settings.qdrant_collection_name,
             timestamp=datetime.now(timezone.utc),
         )
+    except IngestionJobConflict as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "job_id": e.job_id})
     except FileNotFoundError as e:
         raise HTTPException(status_code=404, detail=f"Directory not found: {e}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ingestion failed: {e}")
 
 
-@router.post("/background")
+def _timestamp(value: float | None) -> datetime | None:
+    return datetime.fromtimestamp(value, timezone.utc) if value is not None else None
+
+
+def _job_response(job: IngestJob) -> IngestJobResponse:
+    return IngestJobResponse(
+        job_id=job.job_id,
+        status=job.status,
+        collection_name=job.collection_name,
+        directory_path=job.directory_path,
+        created_at=_timestamp(job.created_at),
+        started_at=_timestamp(job.started_at),
+        finished_at=_timestamp(job.finished_at),
+        files_total=job.files_total,
+        files_done=job.files_done,
+        documents_added=job.documents_added,
+        documents_updated=job.documents_updated,
+        documents_skipped=job.documents_skipped,
+        documents_deleted=job.documents_deleted,
+        chunks_embedded=job.chunks_embedded,
+        eta_seconds=job.eta_seconds,
+        error=job.error,
+    )
+
+
+@router.post("/background", response_model=IngestJobResponse, status_code=202)
 async def ingest_documents_background(
     request: IngestRequest,
-    background_tasks: BackgroundTasks,
-    ingestion_service: IngestionService = Depends(get_ingestion_service),
+    job_manager: IngestionJobManager = Depends(get_ingestion_job_manager),
 ):
     """
-    Queue document ingestion as a background task.
-    Returns immediately while processing continues.
+    Queue document ingestion as a background job.
+    Returns the job immediately; poll GET /ingest/jobs/{job_id} for progress.
+    Only one job per collection runs at a time.
     """
+    try:
+        job = job_manager.submit(request.directory_path, request.file_extensions)
+    except IngestionJobConflict as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "job_id": e.job_id})
+    return _job_response(job)
 
-    def run_ingestion():
-        ingestion_service.ingest_documents(
-            directory_path=request.directory_path,
-            extensions=request.file_extensions,
-        )
 
-    background_tasks.add_task(run_ingestion)
+@router.get("/jobs/{job_id}", response_model=IngestJobResponse)
+async def get_ingestion_job(
+    job_id: str,
+    job_manager: IngestionJobManager = Depends(get_ingestion_job_manager),
+):
+    """Return status and progress of an ingestion job."""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Ingestion job not found: {job_id}")
+    return _job_response(job)
+
 
-    return {"status": "queued", "message": "Ingestion started in background"}
+@router.delete("/jobs/{job_id}", response_model=IngestJobResponse)
+async def cancel_ingestion_job(
+    job_id: str,
+    job_manager: IngestionJobManager = Depends(get_ingestion_job_manager),
+):
+    """
+    Cancel an ingestion job.
+    A running job stops after its current window; finished files stay ingested.
+    """
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Ingestion job not found: {job_id}")
+    return _job_response(job)
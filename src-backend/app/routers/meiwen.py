@@ -2,12 +2,14 @@
 
 import logging
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from llama_index.core.llms import ChatMessage
 
 from app.core.dependencies import get_llm_service
+from app.core.disconnect import ClientDisconnected, DisconnectWatcher
 from app.models.requests import MeiwenCastRequest
 from app.models.responses import MeiwenCastResponse
+from app.services.llm_scheduler import LLMOverloadedError
 from app.services.llm_service import LLMService
 from app.services.meiwen.najia_adapter import NajiaAdapter
 from app.services.meiwen.prompt_builder import PromptBuilder
@@ -20,6 +22,7 @@ router = APIRouter(prefix="/meiwen", tags=["Meiwen"])
 @router.post("/cast", response_model=MeiwenCastResponse)
 async def cast_hexagram(
     payload: MeiwenCastRequest,
+    request: Request,
     llm_service: LLMService = Depends(get_llm_service),
 ):
     try:
@@ -32,13 +35,15 @@ async def cast_hexagram(
 
         ai_response = None
         try:
-            llm = llm_service.get_llm()
             messages = [
                 ChatMessage(role="system", content=system_prompt),
                 ChatMessage(role="user", content=user_prompt),
             ]
-            response = await llm.achat(messages)
+            async with DisconnectWatcher(request) as watcher:
+                response = await watcher.run(llm_service.achat(messages))
             ai_response = response.message.content if response.message else None
+        except (LLMOverloadedError, ClientDisconnected):
+            raise
         except Exception:
             logger.exception("[Meiwen] AI analysis failed")
 
@@ -64,6 +69,8 @@ async def cast_hexagram(
             }
 
         return result
+    except (LLMOverloadedError, ClientDisconnected):
+        raise
     except Exception as e:
         logger.exception("[Meiwen] Cast failed")
         raise HTTPException(status_code=500, detail=str(e)) from e
@@ -5,6 +5,7 @@ from fastapi import APIRouter, Depends, Request
 from sse_starlette.sse import EventSourceResponse
 
 from app.core.dependencies import get_rag_service
+from app.core.disconnect import DisconnectWatcher
 from app.models.requests import QueryRequest
 from app.models.responses import QueryResponse
 from app.services.rag_service import RAGService
@@ -14,28 +15,35 @@ router = APIRouter(prefix="/query", tags=["Query"])
 
 @router.post("/", response_model=QueryResponse)
 async def query(
-    request: QueryRequest,
+    request: Request,
+    query_request: QueryRequest,
     rag_service: RAGService = Depends(get_rag_service),
 ):
     """
     Execute a RAG query and return the complete response.
+    The query is cancelled if the client disconnects first.
     """
-    answer, sources = await rag_service.query(
-        prompt=request.prompt,
-        user_context=request.user_context,
-        top_k=request.top_k,
-    )
+    async with DisconnectWatcher(request) as watcher:
+        answer, sources = await watcher.run(
+            rag_service.query(
+                prompt=query_request.prompt,
+                user_context=query_request.user_context,
+                top_k=query_request.top_k,
+                bypass_cache=query_request.bypass_cache,
+            )
+        )
     return QueryResponse(answer=answer, sources=sources)
 
 
 @router.post("/stream")
 async def stream_query(
-    request: Request,
     query_request: QueryRequest,
     rag_service: RAGService = Depends(get_rag_service),
 ):
     """
     Execute a RAG query with streaming response via SSE.
+    EventSourceResponse cancels the generator, and with it the LLM stream,
+    as soon as the client disconnects.
     """
 
     async def event_generator() -> AsyncGenerator[dict, None]:
@@ -44,10 +52,8 @@ async def stream_query(
                 prompt=query_request.prompt,
                 user_context=query_request.user_context,
                 top_k=query_request.top_k,
+                bypass_cache=query_request.bypass_cache,
             ):
-                if await request.is_disconnected():
-                    break
-
                 yield {
                     "event": "token",
                     "data": token,
@@ -4,22 +4,28 @@ Provides endpoints for astrolabe analysis with detailed palace reports.
 """
 
 import asyncio
-import contextlib
 import json
 import logging
+from collections.abc import AsyncGenerator, Awaitable, Callable
 from typing import Any
 
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, Request
 from llama_index.core.llms import ChatMessage
+from sse_starlette.sse import EventSourceResponse
 
-from app.core.dependencies import get_llm_service, get_ziwei_rag_service
+from app.core.dependencies import get_llm_service, get_palace_report_cache, get_ziwei_rag_service
+from app.core.disconnect import ClientDisconnected, DisconnectWatcher
+from app.core.metrics import CANCELLATIONS, ERRORS, record_cache
+from app.core.tracing import set_span_attributes, span, traced
 from app.models.requests import AstrolabeSubmitRequest
 from app.models.responses import (
     AstrolabeResponse,
     PalaceAnalysisResponse,
     PalaceReport,
 )
+from app.services.llm_scheduler import LLMOverloadedError
 from app.services.llm_service import LLMService
+from app.services.report_cache import PalaceReportCache, report_fingerprint
 from app.services.ziwei_rag import ZiweiRAGService
 from app.services.ziwei_rules import (
     format_mutagen_info,
@@ -112,16 +118,34 @@ def collect_star_names(palace: dict[str, Any]) -> list[str]:
     return unique_names
 
 
+def build_palace_query(palace: dict[str, Any], palace_index: int) -> str:
+    """Build the ancient-text search query for a palace from its name and stars."""
+    palace_name = palace.get("name", f"Palace {palace_index}")
+    star_names = collect_star_names(palace)
+    query_keywords = " ".join([palace_name, *star_names])
+    return f"紫微斗数 {query_keywords}".strip()
+
+
+@traced("ziwei.analyze_palace")
 async def analyze_single_palace(
     palace: dict[str, Any],
     palace_index: int,
     all_palaces: list[dict[str, Any]],
     context: str,
+    rag_context: str,
     llm_service: LLMService,
-    ziwei_rag: ZiweiRAGService,
+    report_cache: PalaceReportCache | None = None,
+    bypass_cache: bool = False,
+    on_token: Callable[[str], Awaitable[None]] | None = None,
 ) -> PalaceReport:
-    """Analyze a single palace and return a report."""
+    """
+    Analyze a single palace and return a report.
+    Reports are served from report_cache when the same prompt was analyzed
+    before with the same model and temperature, unless bypass_cache is set.
+    With on_token the LLM output is streamed and each delta passed to it.
+    """
     palace_name = palace.get("name", f"Palace {palace_index}")
+    set_span_attributes(palace=palace_name, index=palace_index, rag_context_chars=len(rag_context))
 
     # Format stars
     major_stars, minor_stars, adjective_stars = format_palace_stars(palace)
@@ -138,43 +162,66 @@ async def analyze_single_palace(
     # Get mutagen info
     mutagen_info = format_mutagen_info(palace)
 
-    # Search for relevant ancient texts
-    star_names = collect_star_names(palace)
-    query_keywords = " ".join([palace_name, *star_names])
-    query = f"紫微斗数 {query_keywords}".strip()
-    try:
-        rag_context = ziwei_rag.search_context(query, max_results=3)
-    except Exception as e:
-        logger.error(f"RAG search failed for {palace_name}: {e}")
-        rag_context = ""
     if not rag_context:
         logger.info(f"[Palace {palace_index}] RAG context empty for {palace_name}")
 
     # Build the prompt
-    prompt = build_palace_analysis_prompt(
-        palace_name=palace_name,
-        major_stars=major_stars,
-        minor_stars=minor_stars,
-        adjective_stars=adjective_stars,
-        decadal_range=decadal_str,
-        three_parties_context=three_parties_context,
-        mutagen_info=mutagen_info,
-        rag_context=rag_context,
-        context=context,
-    )
+    with span("ziwei.build_prompt") as prompt_span:
+        prompt = build_palace_analysis_prompt(
+            palace_name=palace_name,
+            major_stars=major_stars,
+            minor_stars=minor_stars,
+            adjective_stars=adjective_stars,
+            decadal_range=decadal_str,
+            three_parties_context=three_parties_context,
+            mutagen_info=mutagen_info,
+            rag_context=rag_context,
+            context=context,
+        )
+        prompt_span.set_attribute("prompt_chars", len(prompt))
+
+    fingerprint = None
+    if report_cache is not None:
+        fingerprint = report_fingerprint(
+            prompt, llm_service.settings.llm_model_name, llm_service.settings.llm_temperature
+        )
+        cached = None if bypass_cache else await report_cache.aget(fingerprint)
+        if not bypass_cache:
+            record_cache("palace_report", cached is not None)
+        set_span_attributes(cache_hit=cached is not None)
+        if cached is not None:
+            logger.info(f"[Palace {palace_index}] Report cache hit for {palace_name}")
+            return PalaceReport(name=palace_name, index=palace_index, analysis=cached, cache_hit=True)
 
     # Generate analysis using LLM
     try:
-        llm = llm_service.get_llm()
         messages = [ChatMessage(role="user", content=prompt)]
         logger.info(f"[Palace {palace_index}] Calling LLM for {palace_name}...")
-        response = await llm.achat(messages)
-        analysis = response.message.content or "Analysis generation failed."
+        if on_token is None:
+            response = await llm_service.achat(messages)
+            content = response.message.content
+        else:
+            deltas: list[str] = []
+            async for chunk in llm_service.astream_chat(messages):
+                if chunk.delta:
+                    deltas.append(chunk.delta)
+                    await on_token(chunk.delta)
+            content = "".join(deltas)
+        analysis = content or "Analysis generation failed."
+        set_span_attributes(analysis_chars=len(analysis))
         logger.info(f"[Palace {palace_index}] LLM response received, length: {len(analysis)}")
+        # Only real analyses are cached, never failure messages
+        if fingerprint is not None and content:
+            await report_cache.aput(fingerprint, analysis)
     except asyncio.CancelledError:
+        CANCELLATIONS.inc(stage="palace_analysis")
         logger.info(f"[Palace {palace_index}] Cancelled for {palace_name}")
         raise
+    except LLMOverloadedError:
+        # Shed the whole request rather than return a partial chart
+        raise
     except Exception as e:
+        ERRORS.inc(stage="palace_analysis")
         logger.error(f"[Palace {palace_index}] LLM analysis failed for {palace_name}: {e}")
         analysis = f"Unable to generate analysis for {palace_name}: {str(e)}"
 
@@ -185,27 +232,15 @@ async def analyze_single_palace(
     )
 
 
-async def cancel_on_disconnect(
-    request: Request,
-    tasks: list[asyncio.Task[PalaceReport]],
-) -> None:
-    while True:
-        if await request.is_disconnected():
-            logger.info("[analyze-palaces] Client disconnected, cancelling tasks")
-            for task in tasks:
-                task.cancel()
-            return
-        await asyncio.sleep(0.25)
-
-
 @router.post("/astrolabe", response_model=AstrolabeResponse)
 async def submit_astrolabe(
-    request: AstrolabeSubmitRequest,
+    payload: AstrolabeSubmitRequest,
+    request: Request,
     llm_service: LLMService = Depends(get_llm_service),
 ):
     """Submit astrolabe and generate AI interpretation (simple overview)."""
     # Format astrolabe data for LLM
-    birth_info = request.birth_info
+    birth_info = payload.birth_info
     user_context = f"""
 User: {birth_info.name or 'Unknown'}
 Gender: {'Male' if birth_info.gender == 'male' else 'Female'}
@@ -213,22 +248,57 @@ Birth: {birth_info.birth_year}-{birth_info.birth_month}-{birth_info.birth_day}
 Birth Time: {birth_info.birth_shichen}
 
 Astrolabe Data:
-{json.dumps(request.astrolabe, ensure_ascii=False, indent=2)[:4000]}
+{json.dumps(payload.astrolabe, ensure_ascii=False, indent=2)[:4000]}
 """
 
     # Generate interpretation using LLM
     try:
-        llm = llm_service.get_llm()
         messages = [
             ChatMessage(role="system", content=SIMPLE_SYSTEM_PROMPT),
             ChatMessage(role="user", content=user_context),
         ]
-        response = await llm.achat(messages)
+        async with DisconnectWatcher(request) as watcher:
+            response = await watcher.run(llm_service.achat(messages))
         report = response.message.content
+    except (LLMOverloadedError, ClientDisconnected):
+        raise
     except Exception as e:
         report = f"Unable to generate report: {str(e)}"
 
-    return AstrolabeResponse(astrolabe=request.astrolabe, report=report)
+    return AstrolabeResponse(astrolabe=payload.astrolabe, report=report)
+
+
+async def prepare_palace_inputs(
+    payload: AstrolabeSubmitRequest,
+    ziwei_rag: ZiweiRAGService,
+) -> tuple[list[dict[str, Any]], str, list[str]]:
+    """Return the palaces, the birth context string and each palace's ancient-text context."""
+    birth_info = payload.birth_info
+    astrolabe = payload.astrolabe
+
+    # Extract palaces from astrolabe
+    palaces = astrolabe.get("palaces", [])
+    logger.info(f"[analyze-palaces] Found {len(palaces)} palaces in astrolabe")
+    if not palaces:
+        return [], "", []
+
+    # Build context string
+    context = f"""User: {birth_info.name or 'Unknown'}
+Gender: {'Male' if birth_info.gender == 'male' else 'Female'}
+Birth: {birth_info.birth_year}-{birth_info.birth_month}-{birth_info.birth_day}
+Birth Time: {birth_info.birth_shichen}"""
+
+    # Retrieve ancient texts for all palaces in one batched search, off the event loop
+    queries = [build_palace_query(palace, idx) for idx, palace in enumerate(palaces)]
+    try:
+        rag_contexts = await asyncio.to_thread(
+            ziwei_rag.search_many, queries, 3, payload.full_text
+        )
+    except Exception as e:
+        logger.error(f"[analyze-palaces] RAG search failed: {e}")
+        rag_contexts = ["" for _ in palaces]
+
+    return palaces, context, rag_contexts
 
 
 @router.post("/analyze-palaces", response_model=PalaceAnalysisResponse)
@@ -237,9 +307,11 @@ async def analyze_palaces(
     request: Request,
     llm_service: LLMService = Depends(get_llm_service),
     ziwei_rag: ZiweiRAGService = Depends(get_ziwei_rag_service),
+    report_cache: PalaceReportCache | None = Depends(get_palace_report_cache),
 ):
     """
     Analyze all 12 palaces in parallel and return detailed reports.
+    Palaces whose prompt was analyzed before are answered from the report cache.
 
     This endpoint generates comprehensive analysis for each palace including:
     - Star compositions and their brightness/mutagen status
@@ -248,21 +320,10 @@ async def analyze_palaces(
     - Ancient texts context via RAG
     """
     logger.info("[analyze-palaces] Request received")
-    birth_info = payload.birth_info
-    astrolabe = payload.astrolabe
-
-    # Extract palaces from astrolabe
-    palaces = astrolabe.get("palaces", [])
-    logger.info(f"[analyze-palaces] Found {len(palaces)} palaces in astrolabe")
+    palaces, context, rag_contexts = await prepare_palace_inputs(payload, ziwei_rag)
     if not palaces:
         return PalaceAnalysisResponse(palaces=[])
 
-    # Build context string
-    context = f"""User: {birth_info.name or 'Unknown'}
-Gender: {'Male' if birth_info.gender == 'male' else 'Female'}
-Birth: {birth_info.birth_year}-{birth_info.birth_month}-{birth_info.birth_day}
-Birth Time: {birth_info.birth_shichen}"""
-
     # Analyze all palaces in parallel
     tasks = [
         asyncio.create_task(
@@ -271,23 +332,138 @@ Birth Time: {birth_info.birth_shichen}"""
                 palace_index=idx,
                 all_palaces=palaces,
                 context=context,
+                rag_context=rag_contexts[idx],
                 llm_service=llm_service,
-                ziwei_rag=ziwei_rag,
+                report_cache=report_cache,
+                bypass_cache=payload.bypass_cache,
             )
         )
         for idx, palace in enumerate(palaces)
     ]
-    disconnect_task = asyncio.create_task(cancel_on_disconnect(request, tasks))
 
     try:
-        palace_reports = await asyncio.gather(*tasks)
-    except asyncio.CancelledError:
-        logger.info("[analyze-palaces] Cancelled due to client disconnect")
-        raise HTTPException(status_code=499, detail="Client closed request")
-    finally:
-        disconnect_task.cancel()
-        with contextlib.suppress(asyncio.CancelledError):
-            await disconnect_task
-
-    logger.info(f"[analyze-palaces] Completed, returning {len(palace_reports)} reports")
-    return PalaceAnalysisResponse(palaces=list(palace_reports))
+        async with DisconnectWatcher(request) as watcher:
+            palace_reports = await watcher.run(asyncio.gather(*tasks))
+    except LLMOverloadedError:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    cache_hits = sum(report.cache_hit for report in palace_reports)
+    logger.info(
+        f"[analyze-palaces] Completed, returning {len(palace_reports)} reports "
+        f"({cache_hits} from cache)"
+    )
+    return PalaceAnalysisResponse(
+        palaces=list(palace_reports),
+        cache_hits=cache_hits,
+        cache_misses=len(palace_reports) - cache_hits,
+    )
+
+
+@router.post("/analyze-palaces/stream")
+async def analyze_palaces_stream(
+    payload: AstrolabeSubmitRequest,
+    llm_service: LLMService = Depends(get_llm_service),
+    ziwei_rag: ZiweiRAGService = Depends(get_ziwei_rag_service),
+    report_cache: PalaceReportCache | None = Depends(get_palace_report_cache),
+):
+    """
+    Analyze all 12 palaces in parallel, streaming each report via SSE as it finishes.
+
+    Events:
+    - palace: a completed PalaceReport (JSON), in completion order; a palace
+      that fails carries the error message as its analysis
+    - token: {"index", "name", "delta"} while a palace is generated, only with streamTokens
+    - done: {"palaces", "cache_hits", "cache_misses"} after the last palace
+    - error: {"detail", "retry_after"} if the LLM is overloaded; the stream ends
+
+    Pending palace analyses are cancelled when the client disconnects.
+    """
+    logger.info("[analyze-palaces/stream] Request received")
+
+    async def event_generator() -> AsyncGenerator[dict, None]:
+        palaces, context, rag_contexts = await prepare_palace_inputs(payload, ziwei_rag)
+        events: asyncio.Queue[dict] = asyncio.Queue()
+        reports: list[PalaceReport] = []
+
+        def token_sink(idx: int, palace: dict[str, Any]) -> Callable[[str], Awaitable[None]]:
+            name = palace.get("name", f"Palace {idx}")
+
+            async def on_token(delta: str) -> None:
+                await events.put({
+                    "event": "token",
+                    "data": json.dumps({"index": idx, "name": name, "delta": delta}, ensure_ascii=False),
+                })
+
+            return on_token
+
+        async def run_palace(idx: int, palace: dict[str, Any]) -> None:
+            # Every palace must enqueue exactly one terminal event, or the loop below waits forever
+            try:
+                report = await analyze_single_palace(
+                    palace=palace,
+                    palace_index=idx,
+                    all_palaces=palaces,
+                    context=context,
+                    rag_context=rag_contexts[idx],
+                    llm_service=llm_service,
+                    report_cache=report_cache,
+                    bypass_cache=payload.bypass_cache,
+                    on_token=token_sink(idx, palace) if payload.stream_tokens else None,
+                )
+            except LLMOverloadedError as e:
+                events.put_nowait({
+                    "event": "error",
+                    "data": json.dumps({"detail": str(e), "retry_after": e.retry_after}),
+                })
+                return
+            except Exception as e:
+                ERRORS.inc(stage="palace_analysis")
+                name = palace.get("name", f"Palace {idx}") if isinstance(palace, dict) else f"Palace {idx}"
+                logger.exception(f"[analyze-palaces/stream] Palace {idx} failed for {name}")
+                report = PalaceReport(
+                    name=name,
+                    index=idx,
+                    analysis=f"Unable to generate analysis for {name}: {str(e)}",
+                )
+            reports.append(report)
+            events.put_nowait({"event": "palace", "data": report.model_dump_json()})
+
+        tasks = [
+            asyncio.create_task(run_palace(idx, palace))
+            for idx, palace in enumerate(palaces)
+        ]
+
+        # EventSourceResponse cancels this generator when the client disconnects
+        try:
+            completed = 0
+            while completed < len(tasks):
+                event = await events.get()
+                yield event
+                if event["event"] == "error":
+                    logger.info("[analyze-palaces/stream] Stopped, LLM overloaded")
+                    return
+                completed += event["event"] == "palace"
+
+            cache_hits = sum(report.cache_hit for report in reports)
+            logger.info(
+                f"[analyze-palaces/stream] Completed {completed} palaces ({cache_hits} from cache)"
+            )
+            yield {
+                "event": "done",
+                "data": json.dumps({
+                    "palaces": completed,
+                    "cache_hits": cache_hits,
+                    "cache_misses": completed - cache_hits,
+                }),
+            }
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return EventSourceResponse(
+        event_generator(),
+        send_timeout=30,
+        headers={"Cache-Control": "no-cache"},
+    )
@@ -0,0 +1,141 @@
+"""
+Semantic answer cache for the /query pipeline.
+Serves a stored answer when a new prompt embeds close enough to a previous one
+asked with the same user context, retrieval depth and collection.
+"""
+
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedAnswer:
+    """A stored RAG answer."""
+
+    answer: str
+    sources: list[str]
+
+
+@dataclass
+class _Entry:
+    cached: CachedAnswer
+    created_at: float = field(default_factory=time.monotonic)
+
+
+def scope_key(user_context: str | None, top_k: int, collection: str) -> int:
+    """
+    64-bit hash of everything besides the prompt that determines an answer.
+    Only prompts within the same scope can share an answer.
+    """
+    payload = f"{collection}\0{top_k}\0{user_context or ''}"
+    return int.from_bytes(hashlib.sha256(payload.encode("utf-8")).digest()[:8], "little", signed=True)
+
+
+class SemanticAnswerCache:
+    """
+    Bounded cache of prompt embedding -> (answer, sources).
+    Entries expire after ttl_seconds; beyond max_entries the least recently
+    used entry is evicted. A lookup hits when the cosine distance to a stored
+    prompt in the same scope (see scope_key) is at most max_distance.
+
+    Normalized embeddings live in one preallocated (max_entries, dim) matrix,
+    so a lookup is a single matrix-vector product with no per-call copies.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, max_distance: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        self.hits = 0
+        self.misses = 0
+        # Row index -> entry, least recently used first
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()
+        self._free_rows: list[int] = list(range(max_entries - 1, -1, -1))
+        # Allocated on the first store, once the embedding dimension is known
+        self._vectors: np.ndarray | None = None
+        self._scopes = np.zeros(max(max_entries, 0), dtype=np.int64)
+        self._live = np.zeros(max(max_entries, 0), dtype=bool)
+
+    @staticmethod
+    def _normalize(embedding: list[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _remove(self, row: int) -> None:
+        del self._entries[row]
+        self._live[row] = False
+        self._free_rows.append(row)
+
+    def _expire(self) -> None:
+        deadline = time.monotonic() - self.ttl_seconds
+        expired = [row for row, entry in self._entries.items() if entry.created_at < deadline]
+        for row in expired:
+            self._remove(row)
+
+    def lookup(
+        self,
+        embedding: list[float],
+        user_context: str | None,
+        top_k: int,
+        collection: str,
+    ) -> CachedAnswer | None:
+        """Return the closest cached answer within max_distance, if any."""
+        self._expire()
+        if not self._entries or self._vectors is None or len(embedding) != self._vectors.shape[1]:
+            self.misses += 1
+            return None
+
+        similarities = self._vectors @ self._normalize(embedding)
+        similarities[~(self._live & (self._scopes == scope_key(user_context, top_k, collection)))] = -np.inf
+        best = int(np.argmax(similarities))
+        distance = 1.0 - float(similarities[best])
+        if distance > self.max_distance:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(best)
+        self.hits += 1
+        logger.info(f"Semantic cache hit (cosine distance {distance:.4f})")
+        return self._entries[best].cached
+
+    def store(
+        self,
+        embedding: list[float],
+        user_context: str | None,
+        top_k: int,
+        collection: str,
+        answer: str,
+        sources: list[str],
+    ) -> None:
+        if self.max_entries <= 0 or not answer:
+            return
+        if self._vectors is None or len(embedding) != self._vectors.shape[1]:
+            # First store, or the embedding model changed: start over at the new dimension
+            for row in list(self._entries):
+                self._remove(row)
+            self._vectors = np.zeros((self.max_entries, len(embedding)), dtype=np.float32)
+        if not self._free_rows:
+            self._remove(next(iter(self._entries)))
+
+        row = self._free_rows.pop()
+        self._vectors[row] = self._normalize(embedding)
+        self._scopes[row] = scope_key(user_context, top_k, collection)
+        self._live[row] = True
+        self._entries[row] = _Entry(cached=CachedAnswer(answer=answer, sources=sources))
+
+    def stats(self) -> dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
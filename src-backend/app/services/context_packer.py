@@ -0,0 +1,172 @@
+"""
+Token-budgeted context packing for the /query pipeline.
+Sits between retrieval and prompt building: merges overlapping chunks of the
+same file, orders passages by MMR so near-duplicates don't crowd out other
+evidence, and keeps only what fits the token budget.
+"""
+
+import logging
+from dataclasses import dataclass, field
+
+from llama_index.core.schema import NodeWithScore
+from llama_index.core.utils import get_tokenizer
+
+from app.services.ziwei_search import extract_ngrams
+
+logger = logging.getLogger(__name__)
+
+# Passages joined in the prompt are separated by a blank line
+PASSAGE_SEPARATOR = "\n\n"
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens with llama-index's global tokenizer."""
+    return len(get_tokenizer()(text))
+
+
+def bigram_set(text: str) -> set[str]:
+    return set(extract_ngrams(text.lower(), 2))
+
+
+def jaccard(a: set[str], b: set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+@dataclass
+class Passage:
+    """One or more adjacent chunks of a single source file."""
+
+    text: str
+    score: float
+    source: str
+    doc_key: str | None = None
+    start: int | None = None
+    end: int | None = None
+    tokens: int = 0
+    bigrams: set[str] = field(default_factory=set)
+
+
+@dataclass
+class PackedContext:
+    """Context text chosen for the prompt, with token accounting."""
+
+    text: str
+    sources: list[str]
+    passages: int
+    input_tokens: int
+    packed_tokens: int
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.input_tokens - self.packed_tokens
+
+
+def _to_passage(node: NodeWithScore) -> Passage:
+    inner = node.node
+    return Passage(
+        text=node.get_content(),
+        score=node.score if node.score is not None else 0.0,
+        source=node.metadata.get("file_name", "unknown"),
+        doc_key=inner.ref_doc_id or node.metadata.get("file_path"),
+        start=getattr(inner, "start_char_idx", None),
+        end=getattr(inner, "end_char_idx", None),
+    )
+
+
+def merge_adjacent(passages: list[Passage]) -> list[Passage]:
+    """
+    Merge chunks of the same document whose character ranges touch or overlap,
+    so the overlap shared by neighbouring chunks is sent once.
+    Chunks without offsets are left as they are.
+    """
+    mergeable: list[Passage] = []
+    others: list[Passage] = []
+    for passage in passages:
+        has_offsets = passage.doc_key and passage.start is not None and passage.end is not None
+        (mergeable if has_offsets else others).append(passage)
+
+    merged: list[Passage] = []
+    for passage in sorted(mergeable, key=lambda p: (p.doc_key, p.start)):
+        last = merged[-1] if merged else None
+        if last is not None and last.doc_key == passage.doc_key and passage.start <= last.end:
+            overlap = last.end - passage.start
+            if passage.end > last.end:
+                last.text += passage.text[overlap:]
+                last.end = passage.end
+            last.score = max(last.score, passage.score)
+        else:
+            merged.append(Passage(**vars(passage)))
+    return merged + others
+
+
+class ContextPacker:
+    """
+    Packs retrieved nodes into at most token_budget tokens.
+
+    Passages are picked greedily by maximal marginal relevance:
+    mmr_lambda * relevance - (1 - mmr_lambda) * max similarity to the passages
+    already picked, with similarity measured as character-bigram Jaccard.
+    Passages at least dedup_threshold similar to a picked one are dropped.
+    """
+
+    def __init__(self, mmr_lambda: float = 0.7, dedup_threshold: float = 0.9):
+        self.mmr_lambda = mmr_lambda
+        self.dedup_threshold = dedup_threshold
+
+    def _relevance(self, passages: list[Passage]) -> list[float]:
+        """Min-max normalize retrieval scores; equal scores all count as fully relevant."""
+        scores = [p.score for p in passages]
+        low, high = min(scores), max(scores)
+        if high == low:
+            return [1.0] * len(passages)
+        return [(score - low) / (high - low) for score in scores]
+
+    def pack(self, nodes: list[NodeWithScore], token_budget: int) -> PackedContext:
+        if not nodes:
+            return PackedContext(text="", sources=[], passages=0, input_tokens=0, packed_tokens=0)
+        separator_tokens = count_tokens(PASSAGE_SEPARATOR)
+        input_tokens = count_tokens(PASSAGE_SEPARATOR.join(node.get_content() for node in nodes))
+
+        candidates = merge_adjacent([_to_passage(node) for node in nodes])
+        for passage in candidates:
+            passage.tokens = count_tokens(passage.text)
+            passage.bigrams = bigram_set(passage.text)
+        relevance = dict(zip(map(id, candidates), self._relevance(candidates)))
+
+        selected: list[Passage] = []
+        used = 0
+        remaining = list(candidates)
+        while remaining:
+            best, best_mmr, best_similarity = None, float("-inf"), 0.0
+            for passage in remaining:
+                similarity = max((jaccard(passage.bigrams, s.bigrams) for s in selected), default=0.0)
+                mmr = self.mmr_lambda * relevance[id(passage)] - (1 - self.mmr_lambda) * similarity
+                if mmr > best_mmr:
+                    best, best_mmr, best_similarity = passage, mmr, similarity
+            remaining = [p for p in remaining if p is not best]
+
+            if best_similarity >= self.dedup_threshold:
+                continue
+            cost = best.tokens + (separator_tokens if selected else 0)
+            # A passage that doesn't fit is skipped; a shorter one later may still fit
+            if used + cost > token_budget:
+                continue
+            selected.append(best)
+            used += cost
+
+        text = PASSAGE_SEPARATOR.join(p.text for p in selected)
+        packed = PackedContext(
+            text=text,
+            sources=[p.source for p in selected],
+            passages=len(selected),
+            input_tokens=input_tokens,
+            packed_tokens=count_tokens(text),
+        )
+        logger.info(
+            f"Packed {len(nodes)} nodes into {packed.passages} passages: "
+            f"{packed.packed_tokens}/{packed.input_tokens} tokens "
+            f"({packed.saved_tokens} saved, budget {token_budget})"
+        )
+        return packed
@@ -0,0 +1,171 @@
+"""
+Query-embedding cache wrapped around the remote embedding model.
+Lookups go through an in-process LRU first, then a SQLite file shared by all workers.
+"""
+
+import hashlib
+import logging
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from typing import Any
+
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from pydantic import PrivateAttr
+
+from app.core.cache import LRUCache, SQLiteCache
+from app.core.concurrency import run_blocking
+from app.core.metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Normalize a query so trivially different spellings share one cache entry."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Embedding model that caches query embeddings of an inner model.
+    Text (document) embeddings used during ingestion pass straight through.
+    """
+
+    _inner: BaseEmbedding = PrivateAttr()
+    _memory: LRUCache = PrivateAttr()
+    _disk: SQLiteCache | None = PrivateAttr()
+    _stats_lock: threading.Lock = PrivateAttr()
+    _misses: int = PrivateAttr(default=0)
+    _memory_hits: int = PrivateAttr(default=0)
+    _disk_hits: int = PrivateAttr(default=0)
+    _miss_seconds: float = PrivateAttr(default=0.0)
+    _saved_seconds: float = PrivateAttr(default=0.0)
+
+    def __init__(
+        self,
+        inner: BaseEmbedding,
+        memory_size: int,
+        disk_path: str | None = None,
+        disk_max_entries: int = 100_000,
+        **kwargs: Any,
+    ):
+        super().__init__(
+            model_name=inner.model_name,
+            embed_batch_size=inner.embed_batch_size,
+            **kwargs,
+        )
+        self._inner = inner
+        self._memory = LRUCache(memory_size)
+        self._disk = SQLiteCache(disk_path, max_entries=disk_max_entries) if disk_path else None
+        self._stats_lock = threading.Lock()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    def _cache_key(self, query: str) -> str:
+        payload = f"{self.model_name}\0{normalize_text(query)}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _lookup_memory(self, key: str) -> Embedding | None:
+        embedding = self._memory.get(key)
+        if embedding is not None:
+            self._record_hit(disk=False)
+        return embedding
+
+    def _lookup_disk(self, key: str) -> Embedding | None:
+        """Blocking: reads the SQLite tier."""
+        if self._disk is None:
+            return None
+        blob = self._disk.get(key)
+        if blob is None:
+            return None
+        embedding = array("f", blob).tolist()
+        self._memory.put(key, embedding)
+        self._record_hit(disk=True)
+        return embedding
+
+    def _store_memory(self, key: str, embedding: Embedding, elapsed: float) -> None:
+        with self._stats_lock:
+            self._misses += 1
+            self._miss_seconds += elapsed
+        self._memory.put(key, embedding)
+
+    def _store_disk(self, key: str, embedding: Embedding) -> None:
+        """Blocking: writes the SQLite tier."""
+        if self._disk is not None:
+            self._disk.put(key, array("f", embedding).tobytes())
+
+    def _record_hit(self, disk: bool) -> None:
+        with self._stats_lock:
+            if disk:
+                self._disk_hits += 1
+            else:
+                self._memory_hits += 1
+            # A hit saves what an upstream call costs on average
+            if self._misses:
+                self._saved_seconds += self._miss_seconds / self._misses
+
+    def stats(self) -> dict[str, Any]:
+        """Return hit rate per tier and the embedding latency saved so far."""
+        with self._stats_lock:
+            hits = self._memory_hits + self._disk_hits
+            lookups = hits + self._misses
+            return {
+                "model_name": self.model_name,
+                "lookups": lookups,
+                "memory_hits": self._memory_hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "avg_miss_latency_ms": 1000 * self._miss_seconds / self._misses if self._misses else 0.0,
+                "saved_latency_seconds": self._saved_seconds,
+            }
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        key = self._cache_key(query)
+        embedding = self._lookup_memory(key)
+        if embedding is None:
+            embedding = self._lookup_disk(key)
+        record_cache("embedding", embedding is not None)
+        if embedding is not None:
+            return embedding
+
+        start = time.perf_counter()
+        embedding = self._inner._get_query_embedding(query)
+        self._store_memory(key, embedding, time.perf_counter() - start)
+        self._store_disk(key, embedding)
+        return embedding
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        # Only the in-memory tier is checked on the event loop; SQLite goes to the blocking pool
+        key = self._cache_key(query)
+        embedding = self._lookup_memory(key)
+        if embedding is None and self._disk is not None:
+            embedding = await run_blocking(self._lookup_disk, key)
+        record_cache("embedding", embedding is not None)
+        if embedding is not None:
+            return embedding
+
+        start = time.perf_counter()
+        embedding = await self._inner._aget_query_embedding(query)
+        self._store_memory(key, embedding, time.perf_counter() - start)
+        if self._disk is not None:
+            await run_blocking(self._store_disk, key, embedding)
+        return embedding
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._inner._get_text_embedding(text)
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return await self._inner._aget_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[Embedding]:
+        return self._inner._get_text_embeddings(texts)
+
+    async def _aget_text_embeddings(self, texts: list[str]) -> list[Embedding]:
+        return await self._inner._aget_text_embeddings(texts)
@@ -0,0 +1,121 @@
+"""
+Background health monitor.
+Probes Qdrant and the LLM/embedding endpoints on an interval and keeps the
+latest results in memory, so health checks never touch the network.
+"""
+
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+import httpx
+
+from app.config import Settings
+from app.services.ingestion_service import IngestionService
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DependencyStatus:
+    """Outcome of the latest probe of one dependency."""
+
+    ok: bool
+    latency_ms: float
+    checked_at: datetime
+    error: str | None = None
+
+
+class HealthMonitor:
+    """Periodically probes external dependencies and caches the results."""
+
+    def __init__(self, settings: Settings, ingestion_service: IngestionService):
+        self.settings = settings
+        self.ingestion_service = ingestion_service
+        self.results: dict[str, DependencyStatus] = {}
+        self._task: asyncio.Task | None = None
+        self._http: httpx.AsyncClient | None = None
+
+    def _probes(self) -> dict[str, Callable[[], Awaitable[None]]]:
+        llm_base = self.settings.llm_api_base
+        embedding_base = self.settings.embedding_api_base or llm_base
+        return {
+            "qdrant": self._probe_qdrant,
+            "llm": lambda: self._probe_models(llm_base, self.settings.llm_api_key),
+            "embedding": lambda: self._probe_models(
+                embedding_base, self.settings.embedding_api_key or self.settings.llm_api_key
+            ),
+        }
+
+    async def _probe_qdrant(self) -> None:
+        await self.ingestion_service.get_async_qdrant_client().get_collections()
+
+    async def _probe_models(self, api_base: str, api_key: str) -> None:
+        """GET {api_base}/models, the cheapest authenticated OpenAI-compatible call."""
+        if self._http is None:
+            self._http = httpx.AsyncClient()
+        response = await self._http.get(
+            f"{api_base.rstrip('/')}/models",
+            headers={"Authorization": f"Bearer {api_key}"},
+        )
+        response.raise_for_status()
+
+    async def _run_probe(self, probe: Callable[[], Awaitable[None]]) -> DependencyStatus:
+        start = time.perf_counter()
+        error = None
+        try:
+            await asyncio.wait_for(probe(), timeout=self.settings.health_probe_timeout)
+        except asyncio.TimeoutError:
+            error = f"Timed out after {self.settings.health_probe_timeout}s"
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        return DependencyStatus(
+            ok=error is None,
+            latency_ms=1000 * (time.perf_counter() - start),
+            checked_at=datetime.now(timezone.utc),
+            error=error,
+        )
+
+    async def refresh(self) -> dict[str, DependencyStatus]:
+        """Probe all dependencies concurrently and cache the results."""
+        probes = self._probes()
+        statuses = await asyncio.gather(*(self._run_probe(probe) for probe in probes.values()))
+        results = dict(zip(probes, statuses))
+        for name, status in results.items():
+            previous = self.results.get(name)
+            if not status.ok and (previous is None or previous.ok):
+                logger.warning(f"Health probe for {name} failed: {status.error}")
+        self.results = results
+        return results
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Health refresh failed")
+            await asyncio.sleep(self.settings.health_check_interval)
+
+    def start(self) -> None:
+        """Start the background refresh loop on the running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def is_ok(self, name: str) -> bool:
+        status = self.results.get(name)
+        return status is not None and status.ok
@@ -0,0 +1,316 @@
+"""
+Ingestion job queue.
+Runs ingestion runs in a dedicated thread pool, tracks their progress and
+persists each job's status as JSON so it can be queried after completion.
+
+Jobs run on threads inside the web server process (parsing still fans out
+to worker processes), so they share its CPU and memory and die with it; at
+most ingest_job_workers run at once per process. A per-collection file lock
+keeps ingestion single-flight across all worker processes on a host, and
+jobs left unfinished by a dead process are marked failed at startup.
+"""
+
+import fcntl
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from app.config import Settings
+from app.services.ingestion_service import IngestionCancelled, IngestionService, IngestStats
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+FINISHED_STATES = {JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED}
+
+
+class IngestionJobConflict(Exception):
+    """
+    Raised when a collection is already being ingested.
+    job_id is None when the running ingestion is a synchronous /ingest/ call.
+    """
+
+    def __init__(self, job_id: str | None):
+        if job_id is None:
+            super().__init__("An ingestion run is already in progress for this collection")
+        else:
+            super().__init__(f"Ingestion job {job_id} is already running for this collection")
+        self.job_id = job_id
+
+
+class CollectionLock:
+    """
+    Exclusive lock on a collection, shared by all processes on the host.
+    Backed by flock, so the OS drops it when the holding process dies. The
+    lock file holds the ID of the job that owns it, if any.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.job_id: str | None = None
+        self._file = None
+
+    def acquire(self, job_id: str | None) -> None:
+        """Take the lock without waiting, or raise IngestionJobConflict naming its holder."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        f = open(self.path, "a+", encoding="utf-8")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.seek(0)
+            holder = f.read().strip() or None
+            f.close()
+            raise IngestionJobConflict(holder) from None
+        f.truncate(0)
+        f.write(job_id or "")
+        f.flush()
+        self.job_id = job_id
+        self._file = f
+
+    def release(self) -> None:
+        if self._file is None:
+            return
+        self._file.truncate(0)
+        fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+
+
+@dataclass
+class IngestJob:
+    """Status and progress of one ingestion run."""
+
+    job_id: str
+    collection_name: str
+    directory_path: str | None
+    file_extensions: list[str]
+    status: str = JOB_QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    files_total: int = 0
+    files_done: int = 0
+    documents_added: int = 0
+    documents_updated: int = 0
+    documents_skipped: int = 0
+    documents_deleted: int = 0
+    chunks_embedded: int = 0
+    error: str | None = None
+
+    @property
+    def eta_seconds(self) -> float | None:
+        """Remaining time extrapolated from the files finished so far."""
+        if self.status != JOB_RUNNING or not self.started_at or not self.files_done:
+            return None
+        elapsed = time.time() - self.started_at
+        return elapsed / self.files_done * (self.files_total - self.files_done)
+
+
+class IngestionJobManager:
+    """
+    Queue of ingestion jobs with single-flight protection per collection.
+    Cancellation is cooperative and takes effect at the next window boundary.
+    Only unfinished jobs are kept in memory; finished ones are read back from
+    their status files.
+    """
+
+    def __init__(self, settings: Settings, ingestion_service: IngestionService):
+        self.settings = settings
+        self.ingestion_service = ingestion_service
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.ingest_job_workers,
+            thread_name_prefix="ingest-job",
+        )
+        self._lock = threading.Lock()
+        self._jobs: dict[str, IngestJob] = {}
+        self._cancel_events: dict[str, threading.Event] = {}
+        # collection name -> lock held by the unfinished ingestion in this process
+        self._active: dict[str, CollectionLock] = {}
+
+    def _job_path(self, job_id: str) -> Path:
+        return Path(self.settings.ingest_job_dir) / f"{job_id}.json"
+
+    def _claim(self, collection_name: str, job_id: str | None) -> CollectionLock:
+        """Take the collection's lock, or raise IngestionJobConflict. Call with self._lock held."""
+        active = self._active.get(collection_name)
+        if active is not None:
+            raise IngestionJobConflict(active.job_id)
+        lock = CollectionLock(Path(self.settings.ingest_job_dir) / f"{collection_name}.lock")
+        lock.acquire(job_id)
+        self._active[collection_name] = lock
+        return lock
+
+    def _release(self, collection_name: str, lock: CollectionLock) -> None:
+        with self._lock:
+            if self._active.get(collection_name) is lock:
+                del self._active[collection_name]
+        lock.release()
+
+    def _load(self, path: Path) -> IngestJob | None:
+        try:
+            with open(path, encoding="utf-8") as f:
+                return IngestJob(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def _save(self, job: IngestJob) -> None:
+        """Persist the job status atomically."""
+        path = self._job_path(job.job_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(asdict(job), f, ensure_ascii=False)
+        tmp_path.replace(path)
+
+    def submit(self, directory_path: str | None, file_extensions: list[str]) -> IngestJob:
+        """Queue an ingestion job, or raise IngestionJobConflict if one is unfinished."""
+        collection_name = self.settings.qdrant_collection_name
+        with self._lock:
+            job = IngestJob(
+                job_id=uuid.uuid4().hex,
+                collection_name=collection_name,
+                directory_path=directory_path,
+                file_extensions=file_extensions,
+            )
+            lock = self._claim(collection_name, job.job_id)
+            self._jobs[job.job_id] = job
+            self._cancel_events[job.job_id] = threading.Event()
+            self._save(job)
+
+        self._executor.submit(self._run, job, lock)
+        logger.info(f"Queued ingestion job {job.job_id} for collection {collection_name}")
+        return job
+
+    def get(self, job_id: str) -> IngestJob | None:
+        """Return a job from memory, or from its persisted status file."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+
+        path = self._job_path(job_id)
+        if not path.exists():
+            return None
+        return self._load(path)
+
+    def ingest(self, directory_path: str | None, file_extensions: list[str]) -> IngestStats:
+        """
+        Ingest synchronously in the calling thread, under the same per-collection
+        guard as jobs. Raises IngestionJobConflict if the collection is busy.
+        """
+        collection_name = self.settings.qdrant_collection_name
+        with self._lock:
+            lock = self._claim(collection_name, None)
+        try:
+            return self.ingestion_service.ingest_documents(
+                directory_path=directory_path,
+                extensions=file_extensions,
+            )
+        finally:
+            self._release(collection_name, lock)
+
+    def recover(self) -> None:
+        """
+        Mark jobs left queued or running by a process that died as failed.
+        A collection still locked by a live process is left alone.
+        """
+        unfinished: dict[str, list[Path]] = {}
+        for path in Path(self.settings.ingest_job_dir).glob("*.json"):
+            job = self._load(path)
+            if job is not None and job.status not in FINISHED_STATES:
+                unfinished.setdefault(job.collection_name, []).append(path)
+
+        for collection_name, paths in unfinished.items():
+            try:
+                with self._lock:
+                    lock = self._claim(collection_name, None)
+            except IngestionJobConflict:
+                continue
+            try:
+                for path in paths:
+                    # Re-read under the lock, a live process may have finished it meanwhile
+                    job = self._load(path)
+                    if job is None or job.status in FINISHED_STATES:
+                        continue
+                    job.status = JOB_FAILED
+                    job.error = "Interrupted: the server stopped before the job finished"
+                    job.finished_at = time.time()
+                    self._save(job)
+                    logger.warning(f"Marked interrupted ingestion job {job.job_id} as failed")
+            finally:
+                self._release(collection_name, lock)
+
+    def cancel(self, job_id: str) -> IngestJob | None:
+        """Request cancellation of a job. Finished jobs are returned unchanged."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            event = self._cancel_events.get(job_id)
+        if job is None:
+            return self.get(job_id)
+
+        if event is not None and job.status not in FINISHED_STATES:
+            event.set()
+            logger.info(f"Cancellation requested for ingestion job {job_id} ({job.status})")
+        return job
+
+    def shutdown(self) -> None:
+        """Cancel unfinished jobs and stop the worker pool."""
+        with self._lock:
+            for event in self._cancel_events.values():
+                event.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job: IngestJob, lock: CollectionLock) -> None:
+        cancel_event = self._cancel_events[job.job_id]
+
+        def on_progress(stats: IngestStats, files_done: int, files_total: int) -> None:
+            job.files_done = files_done
+            job.files_total = files_total
+            job.documents_added = stats.added
+            job.documents_updated = stats.updated
+            job.documents_skipped = stats.skipped
+            job.documents_deleted = stats.deleted
+            job.chunks_embedded = stats.chunks
+            self._save(job)
+
+        try:
+            if cancel_event.is_set():
+                raise IngestionCancelled("Cancelled before start")
+            job.status = JOB_RUNNING
+            job.started_at = time.time()
+            self._save(job)
+
+            self.ingestion_service.ingest_documents(
+                directory_path=job.directory_path,
+                extensions=job.file_extensions,
+                progress=on_progress,
+                cancel_event=cancel_event,
+            )
+            job.status = JOB_SUCCEEDED
+        except IngestionCancelled as e:
+            job.status = JOB_CANCELLED
+            job.error = str(e)
+        except FileNotFoundError as e:
+            job.status = JOB_FAILED
+            job.error = f"Directory not found: {e}"
+        except Exception as e:
+            logger.exception(f"Ingestion job {job.job_id} failed")
+            job.status = JOB_FAILED
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            self._save(job)
+            with self._lock:
+                self._cancel_events.pop(job.job_id, None)
+                self._jobs.pop(job.job_id, None)
+            self._release(job.collection_name, lock)
+            logger.info(f"Ingestion job {job.job_id} finished: {job.status}")
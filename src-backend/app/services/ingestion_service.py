@@ -1,9 +1,133 @@
-from qdrant_client import QdrantClient
-from llama_index.core import SimpleDirectoryReader, StorageContext, VectorStoreIndex
+import hashlib
+import json
+import logging
+import multiprocessing
+import threading
+import time
+import uuid
+from collections.abc import Callable
+from functools import partial
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from dataclasses import dataclass
+from pathlib import Path
+
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.http import models as qdrant_models
+from llama_index.core import Settings as LlamaSettings
+from llama_index.core import SimpleDirectoryReader
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import BaseNode, MetadataMode
 from llama_index.readers.file import MarkdownReader
 from llama_index.vector_stores.qdrant import QdrantVectorStore
 
 from app.config import Settings
+from app.services.sparse_encoder import BM25SparseEncoder, reciprocal_rank_fusion
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class IngestStats:
+    """Per-document outcome counts of an incremental ingestion run."""
+
+    added: int = 0
+    updated: int = 0
+    skipped: int = 0
+    deleted: int = 0
+    chunks: int = 0
+    vectors: int = 0
+    # Wall time each pipeline stage was active
+    parse_seconds: float = 0.0
+    embed_seconds: float = 0.0
+    upsert_seconds: float = 0.0
+
+    @property
+    def processed(self) -> int:
+        """Documents that were (re-)embedded in this run."""
+        return self.added + self.updated
+
+    @staticmethod
+    def _rate(count: int, seconds: float) -> float:
+        return count / seconds if seconds > 0 else 0.0
+
+    @property
+    def documents_per_second(self) -> float:
+        return self._rate(self.processed, self.parse_seconds)
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self._rate(self.chunks, self.embed_seconds)
+
+    @property
+    def vectors_per_second(self) -> float:
+        return self._rate(self.vectors, self.upsert_seconds)
+
+
+class IngestionCancelled(Exception):
+    """Raised between windows when an ingestion run is cancelled."""
+
+
+def file_digest(path: Path) -> str:
+    """Return the sha256 content hash of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def parse_file(
+    file_path: str,
+    content_hash: str,
+    chunk_size: int,
+    chunk_overlap: int,
+) -> list[BaseNode]:
+    """
+    Read and chunk a single file.
+    Module-level so it can run in a worker process.
+
+    Node IDs are derived from the document, its content hash and the chunk
+    position, so re-ingesting a file after an interrupted run overwrites the
+    same Qdrant points instead of duplicating them.
+    """
+    reader = SimpleDirectoryReader(
+        input_files=[file_path],
+        file_extractor={".md": MarkdownReader()},
+        filename_as_id=True,
+    )
+    splitter = SentenceSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        id_func=lambda i, doc: str(
+            uuid.uuid5(uuid.NAMESPACE_URL, f"{doc.doc_id}:{content_hash}:{i}")
+        ),
+    )
+    return splitter.get_nodes_from_documents(reader.load_data())
+
+
+class _StageTimer:
+    """Tracks the first start and last end of a pipeline stage."""
+
+    def __init__(self):
+        self.start: float | None = None
+        self.end: float | None = None
+
+    def mark(self) -> None:
+        now = time.perf_counter()
+        if self.start is None:
+            self.start = now
+        self.end = now
+
+    @property
+    def seconds(self) -> float:
+        return (self.end - self.start) if self.start is not None else 0.0
 
 
 class IngestionService:
@@ -12,69 +136,326 @@ class IngestionService:
     def __init__(self, settings: Settings):
         self.settings = settings
         self._qdrant_client: QdrantClient | None = None
+        self._async_qdrant_client: AsyncQdrantClient | None = None
         self._vector_store: QdrantVectorStore | None = None
 
+    def qdrant_client_kwargs(self) -> dict:
+        """Connection options shared by the sync and async Qdrant clients."""
+        return {
+            "url": self.settings.qdrant_url,
+            "api_key": self.settings.qdrant_api_key,
+            "prefer_grpc": self.settings.qdrant_prefer_grpc,
+            "grpc_port": self.settings.qdrant_grpc_port,
+            "timeout": self.settings.qdrant_timeout,
+            "pool_size": self.settings.qdrant_pool_size,
+        }
+
     def get_qdrant_client(self) -> QdrantClient:
-        """Get or create Qdrant client."""
+        """
+        Get or create the sync Qdrant client.
+        Used by ingestion, which runs in worker threads, not on the event loop.
+        """
         if self._qdrant_client is None:
-            self._qdrant_client = QdrantClient(
-                url=self.settings.qdrant_url,
-                api_key=self.settings.qdrant_api_key,
-            )
+            self._qdrant_client = QdrantClient(**self.qdrant_client_kwargs())
         return self._qdrant_client
 
+    def get_async_qdrant_client(self) -> AsyncQdrantClient:
+        """Get or create the async Qdrant client used by request handlers."""
+        if self._async_qdrant_client is None:
+            self._async_qdrant_client = AsyncQdrantClient(**self.qdrant_client_kwargs())
+        return self._async_qdrant_client
+
+    def has_async_client(self) -> bool:
+        """Whether the vector store can serve async queries."""
+        return self._async_qdrant_client is not None
+
     def get_vector_store(self) -> QdrantVectorStore:
         """Get or create vector store."""
         if self._vector_store is None:
+            hybrid_kwargs = {}
+            if self.settings.retrieval_mode == "hybrid":
+                # Chunks hold about one term per token for each n-gram size
+                encoder = BM25SparseEncoder(avg_doc_length=2 * self.settings.chunk_size)
+                hybrid_kwargs = {
+                    "enable_hybrid": True,
+                    "sparse_doc_fn": encoder.encode_documents,
+                    "sparse_query_fn": encoder.encode_queries,
+                    "hybrid_fusion_fn": partial(reciprocal_rank_fusion, rrf_k=self.settings.rrf_k),
+                    "sparse_config": qdrant_models.SparseVectorParams(
+                        modifier=qdrant_models.Modifier.IDF
+                    ),
+                }
             self._vector_store = QdrantVectorStore(
                 client=self.get_qdrant_client(),
+                aclient=self.get_async_qdrant_client(),
                 collection_name=self.settings.qdrant_collection_name,
+                batch_size=self.settings.ingest_upsert_batch_size,
+                **hybrid_kwargs,
             )
         return self._vector_store
 
-    def load_documents(
-        self,
-        directory_path: str | None = None,
-        extensions: list[str] | None = None,
-    ):
-        """Load documents from directory."""
-        path = directory_path or self.settings.documents_path
-        exts = extensions or [".txt", ".md"]
+    def get_manifest_path(self) -> Path:
+        """Manifest of ingested files for the configured collection."""
+        return Path(self.settings.ingest_manifest_dir) / f"{self.settings.qdrant_collection_name}.json"
+
+    def load_manifest(self) -> dict[str, dict]:
+        """Return the manifest: file path -> {"hash": content hash, "point_ids": [...]}."""
+        path = self.get_manifest_path()
+        if not path.exists():
+            return {}
+        with open(path, encoding="utf-8") as f:
+            return json.load(f).get("files", {})
 
-        file_extractor = {".md": MarkdownReader()}
+    def save_manifest(self, files: dict[str, dict]) -> None:
+        """Write the manifest atomically so an interrupted run never leaves a partial file."""
+        path = self.get_manifest_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": files}, f, ensure_ascii=False, indent=1)
+        tmp_path.replace(path)
 
-        reader = SimpleDirectoryReader(
-            input_dir=path,
-            required_exts=exts,
-            recursive=True,
-            file_extractor=file_extractor,
+    @staticmethod
+    def scan_files(directory: Path, extensions: list[str]) -> list[Path]:
+        """List files under directory (recursively) with one of the extensions."""
+        if not directory.is_dir():
+            raise FileNotFoundError(str(directory))
+        exts = {ext.lower() for ext in extensions}
+        return sorted(
+            path.resolve()
+            for path in directory.rglob("*")
+            if path.is_file() and path.suffix.lower() in exts and not path.name.startswith(".")
         )
-        return reader.load_data()
+
+    def delete_points(self, point_ids: list[str]) -> None:
+        """Delete vectors by point ID."""
+        if point_ids:
+            self.get_vector_store().delete_nodes(node_ids=point_ids)
 
     def ingest_documents(
         self,
         directory_path: str | None = None,
         extensions: list[str] | None = None,
-    ) -> int:
-        """Load, chunk, embed, and store documents."""
-        documents = self.load_documents(directory_path, extensions)
+        progress: Callable[[IngestStats, int, int], None] | None = None,
+        cancel_event: threading.Event | None = None,
+    ) -> IngestStats:
+        """
+        Incrementally load, chunk, embed, and store documents.
+
+        Files whose content hash matches the manifest are skipped. New and
+        changed files are (re-)embedded, and the points of changed or removed
+        files are deleted from the collection first.
+
+        Files are streamed through the pipeline in windows of
+        ingest_window_size files, and the manifest is saved after every
+        window, so memory stays bounded by the window and an interrupted run
+        resumes where it stopped.
 
-        storage_context = StorageContext.from_defaults(
-            vector_store=self.get_vector_store()
+        progress is called with (stats, files done, files to embed) before the
+        first and after every window. Setting cancel_event stops the run at
+        the next window boundary with IngestionCancelled.
+        """
+        directory = Path(directory_path or self.settings.documents_path).resolve()
+        exts = extensions or [".txt", ".md"]
+
+        manifest = self.load_manifest()
+        stats = IngestStats()
+
+        current = {str(path): file_digest(path) for path in self.scan_files(directory, exts)}
+        to_embed: list[str] = []
+
+        for file_path, content_hash in current.items():
+            entry = manifest.get(file_path)
+            if entry is None:
+                stats.added += 1
+                to_embed.append(file_path)
+            elif entry["hash"] != content_hash:
+                stats.updated += 1
+                to_embed.append(file_path)
+            else:
+                stats.skipped += 1
+
+        # Files that were ingested from this directory before but are gone now
+        removed = [
+            file_path
+            for file_path in manifest
+            if file_path not in current
+            and Path(file_path).is_relative_to(directory)
+            and Path(file_path).suffix.lower() in {ext.lower() for ext in exts}
+        ]
+        self.delete_points(
+            [point_id for file_path in removed for point_id in manifest[file_path]["point_ids"]]
         )
+        for file_path in removed:
+            del manifest[file_path]
+        stats.deleted = len(removed)
+        self.save_manifest(manifest)
+
+        window_size = max(1, self.settings.ingest_window_size)
+        windows = [to_embed[start : start + window_size] for start in range(0, len(to_embed), window_size)]
+        if progress:
+            progress(stats, 0, len(to_embed))
+        if windows:
+            self._run_windows(windows, current, manifest, stats, progress, cancel_event)
 
-        VectorStoreIndex.from_documents(
-            documents,
-            storage_context=storage_context,
-            show_progress=True,
+        logger.info(
+            f"Ingestion of {directory}: {stats.added} added, {stats.updated} updated, "
+            f"{stats.skipped} skipped, {stats.deleted} deleted, {stats.chunks} chunks embedded"
         )
+        logger.info(
+            f"Ingestion throughput: {stats.documents_per_second:.1f} documents/s, "
+            f"{stats.chunks_per_second:.1f} chunks/s, {stats.vectors_per_second:.1f} vectors/s"
+        )
+        return stats
+
+    def _parse_executor(self) -> Executor:
+        workers = self.settings.ingest_parse_workers
+        if workers > 0:
+            # Spawn, not fork: this runs on a job thread inside a multi-threaded server
+            return ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        # Parse on a single background thread when process parallelism is disabled
+        return ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-parse")
 
-        return len(documents)
+    def _submit_parse(self, pool: Executor, files: dict[str, str]) -> dict[Future, str]:
+        """Queue parsing of files (path -> content hash); returns future -> path."""
+        return {
+            pool.submit(
+                parse_file,
+                file_path,
+                content_hash,
+                self.settings.chunk_size,
+                self.settings.chunk_overlap,
+            ): file_path
+            for file_path, content_hash in files.items()
+        }
 
-    def check_connection(self) -> bool:
-        """Check if Qdrant is reachable."""
+    def _run_windows(
+        self,
+        windows: list[list[str]],
+        current: dict[str, str],
+        manifest: dict[str, dict],
+        stats: IngestStats,
+        progress: Callable[[IngestStats, int, int], None] | None,
+        cancel_event: threading.Event | None,
+    ) -> None:
+        """
+        Stream windows of files through the pipeline with one set of pools.
+        The next window is parsed while the current one is embedded and upserted.
+        """
+        files_total = sum(len(window) for window in windows)
+        files_done = 0
+        timers = _StageTimer(), _StageTimer(), _StageTimer()
+        parse_pool = self._parse_executor()
+        embed_pool = ThreadPoolExecutor(
+            max_workers=self.settings.ingest_embed_concurrency,
+            thread_name_prefix="ingest-embed",
+        )
+        # A single upsert thread keeps upserts ordered and off the coordinating thread
+        upsert_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-upsert")
         try:
-            self.get_qdrant_client().get_collections()
-            return True
-        except Exception:
-            return False
+            timers[0].mark()
+            next_parse = self._submit_parse(parse_pool, {path: current[path] for path in windows[0]})
+            for index, window in enumerate(windows):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise IngestionCancelled(f"Cancelled after {files_done}/{files_total} files")
+                parse_futures = next_parse
+                if index + 1 < len(windows):
+                    next_parse = self._submit_parse(
+                        parse_pool, {path: current[path] for path in windows[index + 1]}
+                    )
+                # Old points of changed files go first; a crash before the manifest
+                # is saved leaves the old hash in place, so the file is redone
+                self.delete_points(
+                    [
+                        point_id
+                        for file_path in window
+                        for point_id in manifest.get(file_path, {}).get("point_ids", [])
+                    ]
+                )
+                point_ids = self.run_pipeline(parse_futures, embed_pool, upsert_pool, stats, timers)
+                for file_path in window:
+                    manifest[file_path] = {"hash": current[file_path], "point_ids": point_ids[file_path]}
+                self.save_manifest(manifest)
+                files_done += len(window)
+                stats.parse_seconds, stats.embed_seconds, stats.upsert_seconds = (
+                    timer.seconds for timer in timers
+                )
+                logger.info(f"Ingested {files_done}/{files_total} files, {stats.chunks} chunks so far")
+                if progress:
+                    progress(stats, files_done, files_total)
+        finally:
+            parse_pool.shutdown(wait=True, cancel_futures=True)
+            embed_pool.shutdown(wait=True, cancel_futures=True)
+            upsert_pool.shutdown(wait=True, cancel_futures=True)
+
+    def run_pipeline(
+        self,
+        parse_futures: dict[Future, str],
+        embed_pool: Executor,
+        upsert_pool: Executor,
+        stats: IngestStats,
+        timers: tuple[_StageTimer, _StageTimer, _StageTimer],
+    ) -> dict[str, list[str]]:
+        """
+        Embed and upsert one window of files as overlapping stages.
+
+        parse_futures (future -> file path) are already parsing. As chunks
+        arrive they are embedded in batches on embed_pool, and embedded nodes
+        are upserted to Qdrant in batches on upsert_pool while parsing and
+        embedding continue. Returns once the window is stored, with the point
+        IDs per file. timers are the (parse, embed, upsert) stage timers.
+        """
+        embed_model = LlamaSettings.embed_model
+        vector_store = self.get_vector_store()
+        embed_batch_size = self.settings.ingest_embed_batch_size
+        upsert_batch_size = self.settings.ingest_upsert_batch_size
+        parse_timer, embed_timer, upsert_timer = timers
+        point_ids: dict[str, list[str]] = {file_path: [] for file_path in parse_futures.values()}
+
+        def embed_batch(nodes: list[BaseNode]) -> list[BaseNode]:
+            embed_timer.mark()
+            texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+            for node, embedding in zip(nodes, embed_model.get_text_embedding_batch(texts)):
+                node.embedding = embedding
+            embed_timer.mark()
+            return nodes
+
+        def upsert(nodes: list[BaseNode]) -> None:
+            upsert_timer.mark()
+            vector_store.add(nodes)
+            upsert_timer.mark()
+            stats.vectors += len(nodes)
+
+        parsing = set(parse_futures)
+        embedding: set[Future] = set()
+        upserts: list[Future] = []
+        to_embed: list[BaseNode] = []
+        to_upsert: list[BaseNode] = []
+        while parsing or embedding:
+            done, _ = wait(parsing | embedding, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in parsing:
+                    parsing.discard(future)
+                    nodes = future.result()
+                    parse_timer.mark()
+                    point_ids[parse_futures[future]] = [node.node_id for node in nodes]
+                    stats.chunks += len(nodes)
+                    to_embed.extend(nodes)
+                else:
+                    embedding.discard(future)
+                    to_upsert.extend(future.result())
+
+            # Embedding starts as soon as a full batch of chunks is parsed
+            while len(to_embed) >= embed_batch_size or (to_embed and not parsing):
+                embedding.add(embed_pool.submit(embed_batch, to_embed[:embed_batch_size]))
+                to_embed = to_embed[embed_batch_size:]
+            while len(to_upsert) >= upsert_batch_size or (to_upsert and not parsing and not embedding):
+                upserts.append(upsert_pool.submit(upsert, to_upsert[:upsert_batch_size]))
+                to_upsert = to_upsert[upsert_batch_size:]
+
+        for future in upserts:
+            future.result()
+        return point_ids
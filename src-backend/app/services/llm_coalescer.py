@@ -0,0 +1,150 @@
+"""
+Single-flight coalescing of identical LLM calls.
+Concurrent calls with the same model, messages and sampling settings share one
+upstream completion; streamed chunks are fanned out to every consumer.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+from collections.abc import AsyncGenerator, AsyncIterator, Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import Any, TypeVar
+
+from llama_index.core.base.llms.types import ChatResponse
+from llama_index.core.llms import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def prompt_key(
+    messages: list[ChatMessage],
+    model: str | None,
+    temperature: float | None,
+    max_tokens: int | None,
+    stream: bool,
+) -> str:
+    """Canonical hash of everything that determines a completion."""
+    payload = json.dumps(
+        {
+            "model": model,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": stream,
+            "messages": [[str(m.role.value), m.content] for m in messages],
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class _Flight:
+    """One upstream call and the callers waiting on it."""
+
+    task: asyncio.Task | None = None
+    waiters: int = 0
+
+
+@dataclass
+class _StreamFlight(_Flight):
+    """One upstream stream, buffered so callers that join late replay it from the start."""
+
+    chunks: list[ChatResponse] = field(default_factory=list)
+    done: bool = False
+    error: BaseException | None = None
+    changed: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def notify(self) -> None:
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+
+class PromptCoalescer:
+    """
+    Deduplicates identical in-flight LLM calls.
+
+    The upstream call is cancelled only when every caller waiting on it has
+    gone; a caller that leaves early does not affect the others.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, _Flight] = {}
+        self._streams: dict[str, _StreamFlight] = {}
+        self.coalesced = 0
+
+    def _leave(self, flights: dict[str, Any], key: str, flight: _Flight) -> None:
+        flight.waiters -= 1
+        if flight.waiters == 0 and not flight.task.done():
+            flight.task.cancel()
+            if flights.get(key) is flight:
+                del flights[key]
+
+    async def run(self, key: str, call: Callable[[], Awaitable[T]]) -> T:
+        """Await call(), or the identical call already in flight under key."""
+        flight = self._calls.get(key)
+        if flight is None:
+            flight = self._calls[key] = _Flight()
+            flight.task = asyncio.ensure_future(call())
+            flight.task.add_done_callback(
+                lambda _: self._calls.pop(key, None) if self._calls.get(key) is flight else None
+            )
+        else:
+            self.coalesced += 1
+            logger.info(f"Coalesced LLM call into in-flight request ({flight.waiters} waiting)")
+
+        flight.waiters += 1
+        try:
+            # Shielded so one caller's cancellation doesn't cancel the shared call
+            return await asyncio.shield(flight.task)
+        finally:
+            self._leave(self._calls, key, flight)
+
+    async def stream(
+        self, key: str, call: Callable[[], AsyncIterator[ChatResponse]]
+    ) -> AsyncGenerator[ChatResponse, None]:
+        """Yield the chunks of call(), or of the identical stream already in flight under key."""
+        flight = self._streams.get(key)
+        if flight is None:
+            flight = self._streams[key] = _StreamFlight()
+            flight.task = asyncio.ensure_future(self._produce(key, flight, call))
+        else:
+            self.coalesced += 1
+            logger.info(f"Coalesced LLM stream into in-flight request ({flight.waiters} waiting)")
+
+        flight.waiters += 1
+        position = 0
+        try:
+            while True:
+                while position < len(flight.chunks):
+                    yield flight.chunks[position]
+                    position += 1
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.changed.wait()
+        finally:
+            self._leave(self._streams, key, flight)
+
+    async def _produce(
+        self, key: str, flight: _StreamFlight, call: Callable[[], AsyncIterator[ChatResponse]]
+    ) -> None:
+        try:
+            async for chunk in call():
+                flight.chunks.append(chunk)
+                flight.notify()
+        except asyncio.CancelledError:
+            flight.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            flight.notify()
+            if self._streams.get(key) is flight:
+                del self._streams[key]
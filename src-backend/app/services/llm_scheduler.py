@@ -0,0 +1,116 @@
+"""
+Process-wide admission control for LLM calls.
+Caps concurrent completions across all requests so bursts queue here instead
+of piling up as provider-side 429s, and sheds load once the queue is full.
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Any
+
+from app.core.metrics import ERRORS, STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Number of recent queue waits kept for percentile stats
+WAIT_SAMPLE_SIZE = 1024
+# Smoothing factor for the moving average of call durations
+DURATION_EWMA_ALPHA = 0.2
+
+
+class LLMOverloadedError(Exception):
+    """Raised when an LLM call is rejected because the scheduler is saturated."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMScheduler:
+    """
+    Limits in-flight LLM calls to max_concurrency.
+
+    Up to max_queue further calls wait for a slot, each for at most
+    queue_timeout seconds; calls beyond that are rejected immediately with
+    LLMOverloadedError, as are calls whose wait times out.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.max_concurrency = max(max_concurrency, 1)
+        self.max_queue = max(max_queue, 0)
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._in_flight = 0
+        self._queued = 0
+        self._admitted = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._waits: deque[float] = deque(maxlen=WAIT_SAMPLE_SIZE)
+        self._max_wait = 0.0
+        self._avg_duration = 1.0
+
+    def retry_after(self) -> int:
+        """Seconds a rejected caller should wait, estimated from recent call durations."""
+        backlog = (self._queued + 1) / self.max_concurrency
+        return max(1, math.ceil(self._avg_duration * backlog))
+
+    def _reject(self, reason: str) -> LLMOverloadedError:
+        ERRORS.inc(stage="llm_admission")
+        retry_after = self.retry_after()
+        logger.warning(
+            f"LLM call rejected ({reason}): {self._in_flight} in flight, "
+            f"{self._queued} queued, retry after {retry_after}s"
+        )
+        return LLMOverloadedError(f"LLM is overloaded ({reason}), retry later", retry_after)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold one concurrency slot for the duration of the block."""
+        if self._semaphore.locked() and self._queued >= self.max_queue:
+            self._rejected += 1
+            raise self._reject("queue full")
+
+        self._queued += 1
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._timed_out += 1
+            raise self._reject(f"no slot within {self.queue_timeout}s") from None
+        finally:
+            self._queued -= 1
+
+        waited = time.perf_counter() - start
+        STAGE_SECONDS.observe(waited, stage="llm_queue_wait")
+        self._waits.append(waited)
+        self._max_wait = max(self._max_wait, waited)
+        self._admitted += 1
+        self._in_flight += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            self._semaphore.release()
+            duration = time.perf_counter() - started
+            self._avg_duration += DURATION_EWMA_ALPHA * (duration - self._avg_duration)
+
+    def stats(self) -> dict[str, Any]:
+        waits = sorted(self._waits)
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+            "queued": self._queued,
+            "admitted": self._admitted,
+            "rejected": self._rejected,
+            "timed_out": self._timed_out,
+            "avg_wait_ms": 1000 * sum(waits) / len(waits) if waits else 0.0,
+            "p95_wait_ms": 1000 * waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+            "max_wait_ms": 1000 * self._max_wait,
+        }
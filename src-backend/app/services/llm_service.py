@@ -1,8 +1,54 @@
+import asyncio
+import time
+from collections.abc import AsyncGenerator
+from contextlib import aclosing
+from typing import Any
+
 from llama_index.core import Settings as LlamaSettings
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.base.llms.types import ChatResponse
+from llama_index.core.llms import ChatMessage
+from llama_index.core.utils import get_tokenizer
 from llama_index.embeddings.openai import OpenAIEmbedding
 from llama_index.llms.openai_like import OpenAILike
 
 from app.config import Settings
+from app.core.metrics import (
+    CANCELLATIONS,
+    ERRORS,
+    LLM_COMPLETION_SECONDS,
+    LLM_COMPLETION_TOKENS,
+    LLM_TIME_TO_FIRST_TOKEN_SECONDS,
+    LLM_TOKENS_PER_SECOND,
+)
+from app.core.tracing import get_tracer, span
+from app.services.embedding_cache import CachedEmbedding
+from app.services.llm_coalescer import PromptCoalescer, prompt_key
+from app.services.llm_scheduler import LLMScheduler
+
+
+def completion_tokens(response: ChatResponse) -> int:
+    """Completion tokens reported by the provider, or counted locally when it reports none."""
+    raw = response.raw
+    usage = raw.get("usage") if isinstance(raw, dict) else getattr(raw, "usage", None)
+    if isinstance(usage, dict):
+        tokens = usage.get("completion_tokens")
+    else:
+        tokens = getattr(usage, "completion_tokens", None)
+    if tokens is not None:
+        return tokens
+    return len(get_tokenizer()(response.message.content or ""))
+
+
+def prompt_chars(messages: list[ChatMessage]) -> int:
+    return sum(len(message.content or "") for message in messages)
+
+
+def record_completion(mode: str, seconds: float, tokens: int) -> None:
+    LLM_COMPLETION_SECONDS.observe(seconds, mode=mode)
+    LLM_COMPLETION_TOKENS.inc(tokens, mode=mode)
+    if seconds > 0 and tokens:
+        LLM_TOKENS_PER_SECOND.observe(tokens / seconds, mode=mode)
 
 
 class LLMService:
@@ -11,7 +57,13 @@ class LLMService:
     def __init__(self, settings: Settings):
         self.settings = settings
         self._llm: OpenAILike | None = None
-        self._embed_model: OpenAIEmbedding | None = None
+        self._embed_model: BaseEmbedding | None = None
+        self.scheduler = LLMScheduler(
+            max_concurrency=settings.llm_max_concurrency,
+            max_queue=settings.llm_max_queue,
+            queue_timeout=settings.llm_queue_timeout,
+        )
+        self.coalescer = PromptCoalescer() if settings.llm_coalesce_enabled else None
 
     def get_llm(self) -> OpenAILike:
         """Get or create the LLM instance."""
@@ -28,16 +80,135 @@ class LLMService:
             )
         return self._llm
 
-    def get_embed_model(self) -> OpenAIEmbedding:
+    def _prompt_key(self, messages: list[ChatMessage], stream: bool) -> str:
+        llm = self.get_llm()
+        return prompt_key(
+            messages,
+            model=getattr(llm, "model", None),
+            temperature=getattr(llm, "temperature", None),
+            max_tokens=getattr(llm, "max_tokens", None),
+            stream=stream,
+        )
+
+    async def achat(self, messages: list[ChatMessage]) -> ChatResponse:
+        """
+        Run a chat completion through the scheduler without blocking the event loop.
+        Identical concurrent calls share one completion.
+        Raises LLMOverloadedError when no slot is available.
+        """
+        if self.coalescer is None:
+            return await self._achat(messages)
+        return await self.coalescer.run(
+            self._prompt_key(messages, stream=False), lambda: self._achat(messages)
+        )
+
+    async def astream_chat(self, messages: list[ChatMessage]) -> AsyncGenerator[ChatResponse, None]:
+        """
+        Stream a chat completion through the scheduler, holding the slot until the
+        stream ends. Identical concurrent streams share one upstream stream.
+        Raises LLMOverloadedError when no slot is available.
+        """
+        if self.coalescer is None:
+            stream = self._astream_chat(messages)
+        else:
+            stream = self.coalescer.stream(
+                self._prompt_key(messages, stream=True), lambda: self._astream_chat(messages)
+            )
+        # Close the inner stream as soon as the caller stops, so it leaves the flight promptly
+        async with aclosing(stream):
+            async for chunk in stream:
+                yield chunk
+
+    async def _achat(self, messages: list[ChatMessage]) -> ChatResponse:
+        llm = self.get_llm()
+        with span(
+            "llm.chat", model=self.settings.llm_model_name, prompt_chars=prompt_chars(messages)
+        ) as call_span:
+            queued = time.perf_counter()
+            async with self.scheduler.slot():
+                start = time.perf_counter()
+                try:
+                    response = await llm.achat(messages)
+                except asyncio.CancelledError:
+                    CANCELLATIONS.inc(stage="llm")
+                    raise
+                except Exception:
+                    ERRORS.inc(stage="llm")
+                    raise
+                seconds, tokens = time.perf_counter() - start, completion_tokens(response)
+                record_completion("chat", seconds, tokens)
+                call_span.set_attributes(
+                    queue_wait_ms=1000 * (start - queued),
+                    completion_tokens=tokens,
+                    tokens_per_second=tokens / seconds if seconds > 0 else None,
+                )
+                return response
+
+    async def _astream_chat(self, messages: list[ChatMessage]) -> AsyncGenerator[ChatResponse, None]:
+        llm = self.get_llm()
+        # Not made current: a generator's context is its consumer's, between chunks
+        tracer = get_tracer()
+        stream_span = tracer.start_span(
+            "llm.stream", model=self.settings.llm_model_name, prompt_chars=prompt_chars(messages)
+        )
+        queued = time.perf_counter()
+        try:
+            async with self.scheduler.slot():
+                start = time.perf_counter()
+                stream_span.set_attribute("queue_wait_ms", 1000 * (start - queued))
+                chunks = 0
+                try:
+                    async for chunk in await llm.astream_chat(messages):
+                        if chunk.delta:
+                            if not chunks:
+                                first_token = time.perf_counter() - start
+                                LLM_TIME_TO_FIRST_TOKEN_SECONDS.observe(first_token)
+                                stream_span.set_attribute("ttft_ms", 1000 * first_token)
+                            # OpenAI-compatible servers send one token per delta
+                            chunks += 1
+                        yield chunk
+                except (asyncio.CancelledError, GeneratorExit):
+                    CANCELLATIONS.inc(stage="llm")
+                    raise
+                except Exception:
+                    ERRORS.inc(stage="llm")
+                    raise
+                seconds = time.perf_counter() - start
+                record_completion("stream", seconds, chunks)
+                stream_span.set_attributes(
+                    completion_tokens=chunks,
+                    tokens_per_second=chunks / seconds if seconds > 0 else None,
+                )
+        except BaseException as e:
+            tracer.end_span(stream_span, e)
+            raise
+        tracer.end_span(stream_span)
+
+    def get_embed_model(self) -> BaseEmbedding:
         """Get or create the embedding model instance (can use separate provider)."""
         if self._embed_model is None:
-            self._embed_model = OpenAIEmbedding(
+            embed_model = OpenAIEmbedding(
                 model_name=self.settings.embedding_model_name,
                 api_base=self.settings.embedding_api_base or self.settings.llm_api_base,
                 api_key=self.settings.embedding_api_key or self.settings.llm_api_key,
             )
+            if self.settings.embedding_cache_size > 0 or self.settings.embedding_cache_path:
+                embed_model = CachedEmbedding(
+                    embed_model,
+                    memory_size=self.settings.embedding_cache_size,
+                    disk_path=self.settings.embedding_cache_path,
+                    disk_max_entries=self.settings.embedding_cache_max_entries,
+                )
+            self._embed_model = embed_model
         return self._embed_model
 
+    def embedding_cache_stats(self) -> dict[str, Any] | None:
+        """Return query-embedding cache statistics, or None if caching is disabled."""
+        embed_model = self.get_embed_model()
+        if isinstance(embed_model, CachedEmbedding):
+            return embed_model.stats()
+        return None
+
     def configure_global_settings(self) -> None:
         """Configure LlamaIndex global settings."""
         LlamaSettings.llm = self.get_llm()
@@ -5,6 +5,9 @@ from datetime import datetime
 import arrow
 from najia.najia import Najia
 
+from app.core.metrics import ERRORS, STAGE_SECONDS
+from app.core.tracing import traced
+
 
 class NajiaAdapter:
     @staticmethod
@@ -24,6 +27,7 @@ class NajiaAdapter:
         return value
 
     @staticmethod
+    @traced("najia.cast_and_compile")
     def cast_and_compile(timestamp_iso: str | None = None) -> dict:
         """
         1. Simulate 3-coin tosses to get lines [6,7,8,9]
@@ -52,10 +56,12 @@ class NajiaAdapter:
         date_str = date.format("YYYY-MM-DD HH:mm")
 
         try:
-            compiler = Najia(verbose=0).compile(params=najia_params, date=date_str)
-            data = compiler.data
-            return NajiaAdapter._transform_to_contract(data, raw_lines, date)
+            with STAGE_SECONDS.time(stage="najia_compile"):
+                compiler = Najia(verbose=0).compile(params=najia_params, date=date_str)
+                data = compiler.data
+                return NajiaAdapter._transform_to_contract(data, raw_lines, date)
         except Exception as e:
+            ERRORS.inc(stage="najia_compile")
             print(f"Najia Compile Error: {e}")
             raise
 
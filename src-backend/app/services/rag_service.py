@@ -2,14 +2,27 @@ import logging
 from collections.abc import AsyncGenerator
 
 from llama_index.core import VectorStoreIndex
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.base.llms.types import ChatResponse
 from llama_index.core.llms import ChatMessage
+from llama_index.core.schema import NodeWithScore, QueryBundle
 
 from app.config import Settings
+from app.core.concurrency import has_native_async, run_blocking
+from app.core.metrics import STAGE_SECONDS, record_cache
+from app.core.tracing import span
+from app.services.answer_cache import SemanticAnswerCache
+from app.services.context_packer import ContextPacker, PackedContext, count_tokens
 from app.services.ingestion_service import IngestionService
 from app.services.llm_service import LLMService
 
 logger = logging.getLogger(__name__)
 
+# Cached answers are replayed to streaming clients in chunks of this many characters
+CACHE_REPLAY_CHUNK_CHARS = 16
+
+SYSTEM_PROMPT = "You are a helpful assistant. Answer based on the provided context."
+
 
 class RAGService:
     """Service for RAG query pipeline."""
@@ -24,6 +37,17 @@ class RAGService:
         self.ingestion_service = ingestion_service
         self.llm_service = llm_service
         self._index: VectorStoreIndex | None = None
+        self._answer_cache: SemanticAnswerCache | None = None
+        self._context_packer = ContextPacker(
+            mmr_lambda=settings.context_mmr_lambda,
+            dedup_threshold=settings.context_dedup_threshold,
+        )
+        if settings.semantic_cache_enabled:
+            self._answer_cache = SemanticAnswerCache(
+                max_entries=settings.semantic_cache_max_entries,
+                ttl_seconds=settings.semantic_cache_ttl_seconds,
+                max_distance=settings.semantic_cache_max_distance,
+            )
 
     def get_index(self) -> VectorStoreIndex:
         """Get or create the vector store index."""
@@ -35,6 +59,59 @@ class RAGService:
             )
         return self._index
 
+    def get_retriever(self, top_k: int) -> BaseRetriever:
+        """
+        Build a retriever for the configured retrieval mode.
+        In hybrid mode, dense and sparse candidates are fused down to top_k.
+        """
+        index = self.get_index()
+        if self.settings.retrieval_mode == "hybrid":
+            candidates = max(top_k, self.settings.hybrid_candidate_k)
+            return index.as_retriever(
+                vector_store_query_mode="hybrid",
+                similarity_top_k=candidates,
+                sparse_top_k=candidates,
+                hybrid_top_k=top_k,
+            )
+        return index.as_retriever(similarity_top_k=top_k)
+
+    async def aretrieve(
+        self, retriever: BaseRetriever, query: str | QueryBundle
+    ) -> list[NodeWithScore]:
+        """
+        Retrieve nodes without blocking the event loop.
+        Falls back to the blocking pool when the retriever or vector store has no async path.
+        """
+        with span("rag.retrieve", mode=self.settings.retrieval_mode) as retrieve_span:
+            with STAGE_SECONDS.time(stage="rag_retrieve"):
+                if self.ingestion_service.has_async_client() and has_native_async(
+                    retriever, "_aretrieve", BaseRetriever
+                ):
+                    nodes = await retriever.aretrieve(query)
+                else:
+                    nodes = await run_blocking(retriever.retrieve, query)
+            retrieve_span.set_attribute("nodes", len(nodes))
+            return nodes
+
+    async def aembed_query(self, prompt: str) -> list[float]:
+        """
+        Embed the prompt as its own pipeline stage.
+        The embedding is passed to the retriever and the semantic answer cache,
+        so each query is embedded exactly once.
+        """
+        with span("rag.embed"), STAGE_SECONDS.time(stage="rag_embed"):
+            return await self.llm_service.get_embed_model().aget_query_embedding(prompt)
+
+    async def achat(self, messages: list[ChatMessage]) -> ChatResponse:
+        """Run a chat completion through the shared LLM scheduler."""
+        return await self.llm_service.achat(messages)
+
+    async def astream_chat(self, messages: list[ChatMessage]) -> AsyncGenerator[str, None]:
+        """Stream completion deltas through the shared LLM scheduler."""
+        async for chunk in self.llm_service.astream_chat(messages):
+            if chunk.delta:
+                yield chunk.delta
+
     def build_prompt_with_context(
         self,
         prompt: str,
@@ -52,17 +129,46 @@ class RAGService:
 
         return "\n".join(parts)
 
+    def context_token_budget(self, prompt: str, user_context: str | None) -> int:
+        """
+        Tokens left for retrieved context once the system prompt, question,
+        user context and the completion reserve are accounted for.
+        CONTEXT_TOKEN_BUDGET, when set, caps it further.
+        """
+        fixed = count_tokens(SYSTEM_PROMPT) + count_tokens(
+            self.build_prompt_with_context(prompt, user_context, "")
+        )
+        available = self.settings.llm_context_window - self.settings.llm_max_tokens - fixed
+        if self.settings.context_token_budget:
+            available = min(available, self.settings.context_token_budget)
+        return max(available, 0)
+
+    def pack_context(
+        self, prompt: str, user_context: str | None, nodes: list[NodeWithScore]
+    ) -> PackedContext:
+        """Merge, deduplicate and trim retrieved nodes to the context token budget."""
+        with STAGE_SECONDS.time(stage="rag_pack"):
+            return self._context_packer.pack(nodes, self.context_token_budget(prompt, user_context))
+
     async def query(
         self,
         prompt: str,
         user_context: str | None = None,
         top_k: int = 5,
+        bypass_cache: bool = False,
     ) -> tuple[str, list[str]]:
         """Execute a RAG query and return response with sources."""
-        index = self.get_index()
+        embedding = await self.aembed_query(prompt)
+        if self._answer_cache is not None and not bypass_cache:
+            cached = self._answer_cache.lookup(
+                embedding, user_context, top_k, self.settings.qdrant_collection_name
+            )
+            record_cache("answer", cached is not None)
+            if cached is not None:
+                return cached.answer, cached.sources
 
-        retriever = index.as_retriever(similarity_top_k=top_k)
-        nodes = retriever.retrieve(prompt)
+        retriever = self.get_retriever(top_k)
+        nodes = await self.aretrieve(retriever, QueryBundle(query_str=prompt, embedding=embedding))
 
         logger.info(f"RAG Retrieved {len(nodes)} nodes for query: {prompt}")
         for i, node in enumerate(nodes):
@@ -71,38 +177,63 @@ class RAGService:
             logger.info(f"Node {i+1} [score: {score}, source: {source}]:")
             logger.info(f"Content: {node.get_content()[:200]}...")
 
-        retrieved_context = "\n\n".join([node.get_content() for node in nodes])
-        sources = [node.metadata.get("file_name", "unknown") for node in nodes]
+        with span("rag.build_prompt") as prompt_span:
+            packed = self.pack_context(prompt, user_context, nodes)
+            retrieved_context = packed.text
+            sources = packed.sources
 
-        logger.info(f"Total retrieved context length: {len(retrieved_context)} characters")
+            logger.info(f"Total retrieved context length: {len(retrieved_context)} characters")
 
-        final_prompt = self.build_prompt_with_context(
-            prompt, user_context, retrieved_context
-        )
+            final_prompt = self.build_prompt_with_context(
+                prompt, user_context, retrieved_context
+            )
+            prompt_span.set_attributes(
+                passages=packed.passages,
+                context_tokens=packed.packed_tokens,
+                saved_tokens=packed.saved_tokens,
+                prompt_chars=len(final_prompt),
+            )
 
-        llm = self.llm_service.get_llm()
         messages = [
-            ChatMessage(
-                role="system",
-                content="You are a helpful assistant. Answer based on the provided context.",
-            ),
+            ChatMessage(role="system", content=SYSTEM_PROMPT),
             ChatMessage(role="user", content=final_prompt),
         ]
-        response = llm.chat(messages)
+        response = await self.achat(messages)
+        answer, unique_sources = str(response.message.content), list(set(sources))
+
+        if self._answer_cache is not None:
+            self._answer_cache.store(
+                embedding,
+                user_context,
+                top_k,
+                self.settings.qdrant_collection_name,
+                answer,
+                unique_sources,
+            )
 
-        return str(response.message.content), list(set(sources))
+        return answer, unique_sources
 
     async def stream_query(
         self,
         prompt: str,
         user_context: str | None = None,
         top_k: int = 5,
+        bypass_cache: bool = False,
     ) -> AsyncGenerator[str, None]:
         """Execute a streaming RAG query."""
-        index = self.get_index()
+        embedding = await self.aembed_query(prompt)
+        if self._answer_cache is not None and not bypass_cache:
+            cached = self._answer_cache.lookup(
+                embedding, user_context, top_k, self.settings.qdrant_collection_name
+            )
+            record_cache("answer", cached is not None)
+            if cached is not None:
+                for start in range(0, len(cached.answer), CACHE_REPLAY_CHUNK_CHARS):
+                    yield cached.answer[start : start + CACHE_REPLAY_CHUNK_CHARS]
+                return
 
-        retriever = index.as_retriever(similarity_top_k=top_k)
-        nodes = retriever.retrieve(prompt)
+        retriever = self.get_retriever(top_k)
+        nodes = await self.aretrieve(retriever, QueryBundle(query_str=prompt, embedding=embedding))
 
         logger.info(f"RAG Stream Retrieved {len(nodes)} nodes for query: {prompt}")
         for i, node in enumerate(nodes):
@@ -111,24 +242,40 @@ class RAGService:
             logger.info(f"Node {i+1} [score: {score}, source: {source}]:")
             logger.info(f"Content: {node.get_content()[:200]}...")
 
-        retrieved_context = "\n\n".join([node.get_content() for node in nodes])
+        with span("rag.build_prompt") as prompt_span:
+            packed = self.pack_context(prompt, user_context, nodes)
+            retrieved_context = packed.text
+            sources = packed.sources
 
-        logger.info(f"Total retrieved context length: {len(retrieved_context)} characters")
+            logger.info(f"Total retrieved context length: {len(retrieved_context)} characters")
 
-        final_prompt = self.build_prompt_with_context(
-            prompt, user_context, retrieved_context
-        )
+            final_prompt = self.build_prompt_with_context(
+                prompt, user_context, retrieved_context
+            )
+            prompt_span.set_attributes(
+                passages=packed.passages,
+                context_tokens=packed.packed_tokens,
+                saved_tokens=packed.saved_tokens,
+                prompt_chars=len(final_prompt),
+            )
 
-        llm = self.llm_service.get_llm()
         messages = [
-            ChatMessage(
-                role="system",
-                content="You are a helpful assistant. Answer based on the provided context.",
-            ),
+            ChatMessage(role="system", content=SYSTEM_PROMPT),
             ChatMessage(role="user", content=final_prompt),
         ]
 
-        response_stream = llm.stream_chat(messages)
-        for chunk in response_stream:
-            if chunk.delta:
-                yield chunk.delta
+        tokens: list[str] = []
+        async for token in self.astream_chat(messages):
+            tokens.append(token)
+            yield token
+
+        # Only a stream that ran to completion is worth replaying later
+        if self._answer_cache is not None:
+            self._answer_cache.store(
+                embedding,
+                user_context,
+                top_k,
+                self.settings.qdrant_collection_name,
+                "".join(tokens),
+                list(set(sources)),
+            )
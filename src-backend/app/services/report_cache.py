@@ -0,0 +1,51 @@
+"""
+Content-addressed cache of palace analyses.
+A report is a function of its fully built prompt and the model settings, so
+identical palace configurations share one LLM call across users and workers.
+"""
+
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Any
+
+from app.core.cache import SQLiteCache
+from app.core.concurrency import run_blocking
+
+logger = logging.getLogger(__name__)
+
+
+def report_fingerprint(prompt: str, model: str, temperature: float) -> str:
+    """Canonical hash of everything that determines a generated report."""
+    payload = json.dumps(
+        {"prompt": prompt, "model": model, "temperature": temperature},
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PalaceReportCache:
+    """Disk-backed palace report cache shared by all workers on a host."""
+
+    def __init__(self, path: str | Path, max_entries: int, ttl_seconds: float | None):
+        self._store = SQLiteCache(path, max_entries=max_entries, ttl_seconds=ttl_seconds)
+
+    def get(self, fingerprint: str) -> str | None:
+        value = self._store.get(fingerprint)
+        return value.decode("utf-8") if value is not None else None
+
+    def put(self, fingerprint: str, analysis: str) -> None:
+        self._store.put(fingerprint, analysis.encode("utf-8"))
+
+    async def aget(self, fingerprint: str) -> str | None:
+        """Like get, but runs the SQLite read in the blocking pool."""
+        return await run_blocking(self.get, fingerprint)
+
+    async def aput(self, fingerprint: str, analysis: str) -> None:
+        """Like put, but runs the SQLite write in the blocking pool."""
+        await run_blocking(self.put, fingerprint, analysis)
+
+    def stats(self) -> dict[str, Any]:
+        return self._store.stats()
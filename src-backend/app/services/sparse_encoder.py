@@ -0,0 +1,113 @@
+"""
+BM25-style sparse vectors and rank fusion for hybrid retrieval in Qdrant.
+
+Chinese text is split into character unigrams and bigrams, the same terms the
+Ziwei index uses, so exact star, palace and hexagram names match even when the
+dense embedding misses them. Latin text is split into words. Terms are hashed
+into a stable 31-bit index space; Qdrant applies IDF at query time through the
+collection's IDF modifier, so documents carry only saturated term frequencies.
+"""
+
+import re
+import zlib
+from collections import Counter, defaultdict
+
+from llama_index.core.vector_stores.types import VectorStoreQueryResult
+
+from app.services.ziwei_search import BM25_B, BM25_K1, NGRAM_SIZES, extract_ngrams
+
+_CJK_RUN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+_WORD = re.compile(r"[a-z0-9]+")
+
+SparseVectors = tuple[list[list[int]], list[list[float]]]
+
+
+def sparse_terms(text: str) -> list[str]:
+    """Return the terms of a text: CJK character n-grams and Latin words."""
+    text = text.lower()
+    terms = _WORD.findall(text)
+    for run in _CJK_RUN.findall(text):
+        for size in NGRAM_SIZES:
+            terms.extend(extract_ngrams(run, size))
+    return terms
+
+
+def term_index(term: str) -> int:
+    """Map a term to a sparse vector index that is stable across processes."""
+    return zlib.crc32(term.encode("utf-8")) & 0x7FFFFFFF
+
+
+def _to_sparse(weights: dict[int, float]) -> tuple[list[int], list[float]]:
+    indices = sorted(weights)
+    return indices, [float(weights[i]) for i in indices]
+
+
+class BM25SparseEncoder:
+    """
+    Sparse document/query encoder for QdrantVectorStore's sparse_doc_fn and
+    sparse_query_fn hooks.
+
+    avg_doc_length is the expected number of terms in a chunk. Chunks are
+    encoded independently during ingestion, so a nominal average stands in for
+    the corpus statistic in BM25's length normalization.
+    """
+
+    def __init__(self, avg_doc_length: float):
+        self.avg_doc_length = max(avg_doc_length, 1.0)
+
+    def encode_documents(self, texts: list[str]) -> SparseVectors:
+        all_indices, all_values = [], []
+        for text in texts:
+            terms = sparse_terms(text)
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * len(terms) / self.avg_doc_length)
+            weights: dict[int, float] = defaultdict(float)
+            for term, tf in Counter(terms).items():
+                # Hash collisions add up rather than overwrite
+                weights[term_index(term)] += tf * (BM25_K1 + 1) / (tf + norm)
+            indices, values = _to_sparse(weights)
+            all_indices.append(indices)
+            all_values.append(values)
+        return all_indices, all_values
+
+    def encode_queries(self, texts: list[str]) -> SparseVectors:
+        all_indices, all_values = [], []
+        for text in texts:
+            indices, values = _to_sparse(
+                Counter(term_index(term) for term in set(sparse_terms(text)))
+            )
+            all_indices.append(indices)
+            all_values.append(values)
+        return all_indices, all_values
+
+
+def reciprocal_rank_fusion(
+    dense_result: VectorStoreQueryResult,
+    sparse_result: VectorStoreQueryResult,
+    alpha: float = 0.5,
+    top_k: int = 2,
+    rrf_k: int = 60,
+) -> VectorStoreQueryResult:
+    """
+    Fuse dense and sparse results by rank instead of raw score.
+    Each list contributes weight / (rrf_k + rank); alpha weights the dense list.
+    Scores of the two retrievers are on unrelated scales, so ranks fuse more
+    robustly than normalized scores.
+    """
+    scores: Counter[str] = Counter()
+    nodes = {}
+    for result, weight in ((dense_result, alpha), (sparse_result, 1 - alpha)):
+        ranked = sorted(
+            zip(result.similarities or [], result.nodes or []),
+            key=lambda pair: pair[0],
+            reverse=True,
+        )
+        for rank, (_, node) in enumerate(ranked, start=1):
+            scores[node.node_id] += weight / (rrf_k + rank)
+            nodes.setdefault(node.node_id, node)
+
+    fused = scores.most_common(top_k)
+    return VectorStoreQueryResult(
+        nodes=[nodes[node_id] for node_id, _ in fused],
+        similarities=[score for _, score in fused],
+        ids=[node_id for node_id, _ in fused],
+    )
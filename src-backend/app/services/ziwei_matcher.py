@@ -0,0 +1,75 @@
+"""
+Aho-Corasick multi-keyword matcher for Ziwei retrieval.
+Finds every occurrence of every keyword in a single pass over a text.
+"""
+
+from collections import Counter, deque
+from collections.abc import Iterable, Iterator
+from functools import cache
+
+from app.services.ziwei_rules import PALACE_NAMES, STAR_NAMES
+
+
+class AhoCorasick:
+    """Keyword automaton with goto, failure and output tables."""
+
+    def __init__(self, keywords: Iterable[str]):
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._output: list[tuple[str, ...]] = [()]
+
+        self.keywords = tuple(dict.fromkeys(k for k in keywords if k))
+        for keyword in self.keywords:
+            state = 0
+            for ch in keyword:
+                next_state = self._goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                    self._goto[state][ch] = next_state
+                state = next_state
+            self._output[state] += (keyword,)
+
+        # Breadth-first pass so each state's failure link is resolved before its children
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(ch, 0)
+                self._output[next_state] += self._output[self._fail[next_state]]
+
+    def iter_matches(self, text: str) -> Iterator[tuple[int, str]]:
+        """Yield (start_offset, keyword) for every keyword occurrence in text."""
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for keyword in output[state]:
+                yield i - len(keyword) + 1, keyword
+
+    def count(self, text: str) -> Counter[str]:
+        """Count occurrences of every keyword in text."""
+        return Counter(keyword for _, keyword in self.iter_matches(text))
+
+
+def vocabulary() -> list[str]:
+    """The closed vocabulary of palace names (with and without 宫) and star names."""
+    palace_forms = [*PALACE_NAMES, *(f"{name}宫" for name in PALACE_NAMES if not name.endswith("宫"))]
+    return [*palace_forms, *STAR_NAMES]
+
+
+@cache
+def vocabulary_matcher() -> AhoCorasick:
+    """
+    Automaton for the closed vocabulary of palace and star names.
+    Built once per process and reused for every knowledge base load.
+    """
+    return AhoCorasick(vocabulary())
@@ -1,70 +1,149 @@
 """
 Ziwei RAG (Retrieval-Augmented Generation) service.
-Uses keyword-based search to retrieve relevant ancient texts from the knowledge base.
+Uses keyword-based BM25 search to retrieve relevant ancient texts from the knowledge base.
 """
 
 import json
 import logging
+import threading
+from collections.abc import Sequence
 from pathlib import Path
 from typing import Any
 
+from app.core.cache import LRUCache
+from app.core.metrics import STAGE_SECONDS, record_cache
+from app.core.tracing import set_span_attributes, traced
+from app.services.ziwei_search import ZiweiSearchIndex
+from app.services.ziwei_snapshot import flatten_nodes, load_snapshot
+from app.services.ziwei_snippets import extract_snippet
+
 logger = logging.getLogger(__name__)
 
 # Path to the knowledge base
 ZIWEI_INDEX_PATH = Path(__file__).parent.parent / "data" / "ziwei_index.json"
+# Precompiled snapshot of the knowledge base (built by `python -m app.services.ziwei_snapshot`)
+ZIWEI_SNAPSHOT_PATH = Path(__file__).parent.parent / "data" / "ziwei_index.snapshot"
 
 
 class ZiweiRAGService:
     """
     RAG service for Ziwei Dou Shu ancient texts.
-    Uses keyword-based search to find relevant nodes from the knowledge base.
+    Uses an inverted index over the knowledge base to find relevant nodes.
     """
 
-    def __init__(self):
-        self._index_data: dict[str, Any] | None = None
-        self._all_nodes: list[dict[str, Any]] = []
+    def __init__(self, cache_size: int = 1024, snippet_chars: int = 600, snippet_window: int = 60):
+        # Passages are cut to the text around keyword hits, at most snippet_chars
+        # characters each; 0 always returns full node text
+        self.snippet_chars = snippet_chars
+        self.snippet_window = snippet_window
+        self._all_nodes: Sequence[dict[str, Any]] = []
+        self._search_index: ZiweiSearchIndex | None = None
+        # Searches run in worker threads, so the lazy load must happen only once
+        self._load_lock = threading.Lock()
+        # (formatted result, full-text length) keyed by the normalized keyword
+        # set, max_results and passage mode
+        self._result_cache = LRUCache(cache_size)
 
     def _load_index(self) -> None:
-        """Load the knowledge base index from JSON file."""
-        if self._index_data is not None:
+        """Load the knowledge base on first use."""
+        if self._search_index is not None:
+            return
+
+        with self._load_lock:
+            if self._search_index is None:
+                self._load_index_locked()
+
+    def reload(self) -> None:
+        """Drop the loaded knowledge base and cached results; the next search reloads it."""
+        with self._load_lock:
+            self._search_index = None
+            self._all_nodes = []
+            self._result_cache.clear()
+        logger.info("Ziwei knowledge base marked for reload")
+
+    def cache_stats(self) -> dict[str, Any]:
+        """Return hit/miss counters of the search result cache."""
+        return self._result_cache.stats()
+
+    def _load_index_locked(self) -> None:
+        """Load the knowledge base, preferring the mmapped snapshot over the JSON file."""
+        # Results computed against a previous knowledge base are no longer valid
+        self._result_cache.clear()
+
+        snapshot = load_snapshot(ZIWEI_SNAPSHOT_PATH, ZIWEI_INDEX_PATH)
+        if snapshot is not None:
+            self._all_nodes = snapshot.nodes
+            self._search_index = snapshot
+            logger.info(
+                f"Mapped Ziwei knowledge base snapshot with {len(self._all_nodes)} nodes, "
+                f"{snapshot.num_terms} index terms"
+            )
             return
 
         try:
             with open(ZIWEI_INDEX_PATH, encoding="utf-8") as f:
-                self._index_data = json.load(f)
+                index_data = json.load(f)
 
             # Flatten all nodes for easier searching
-            self._flatten_nodes(self._index_data.get("structure", []))
+            nodes: list[dict[str, Any]] = []
+            flatten_nodes(index_data.get("structure", []), nodes)
+            self._all_nodes = nodes
+            self._search_index = ZiweiSearchIndex(nodes)
             logger.info(
-                f"Loaded Ziwei knowledge base with {len(self._all_nodes)} nodes"
+                f"Loaded Ziwei knowledge base with {len(self._all_nodes)} nodes, "
+                f"{self._search_index.num_terms} index terms"
             )
         except FileNotFoundError:
             logger.warning(f"Ziwei index file not found: {ZIWEI_INDEX_PATH}")
-            self._index_data = {"structure": []}
+            self._search_index = ZiweiSearchIndex([])
         except json.JSONDecodeError as e:
             logger.error(f"Failed to parse Ziwei index: {e}")
-            self._index_data = {"structure": []}
-
-    def _flatten_nodes(self, nodes: list[dict[str, Any]]) -> None:
-        """Recursively flatten all nodes into a flat list."""
-        for node in nodes:
-            if node.get("text"):
-                self._all_nodes.append({
-                    "title": node.get("title", ""),
-                    "node_id": node.get("node_id", ""),
-                    "text": node.get("text", ""),
-                    "summary": node.get("summary", ""),
-                })
-            if node.get("nodes"):
-                self._flatten_nodes(node["nodes"])
-
-    def search_context(self, query: str, max_results: int = 3) -> str:
+            self._search_index = ZiweiSearchIndex([])
+
+    @staticmethod
+    def _extract_keywords(query: str) -> list[str]:
+        """Split a query into keywords, dropping the generic 紫微斗数 prefix."""
+        return [k.strip() for k in query.replace("紫微斗数", "").split() if k.strip()]
+
+    def _use_full_text(self, full_text: bool) -> bool:
+        return full_text or self.snippet_chars <= 0
+
+    def _cache_key(
+        self, keywords: list[str], max_results: int, full_text: bool
+    ) -> tuple[tuple[str, ...], int, int]:
+        """Scores do not depend on keyword order or repeats, so the key is the sorted set."""
+        mode = 0 if self._use_full_text(full_text) else self.snippet_chars
+        return tuple(sorted({k.lower() for k in keywords})), max_results, mode
+
+    @staticmethod
+    def _format_node(node: dict[str, Any], text: str | None = None) -> str:
+        return f"### {node['title']}\n{node['text'] if text is None else text}"
+
+    def _format_passage(self, node: dict[str, Any], keywords: list[str], full_text: bool) -> str:
+        """Format a node with its full text or only the snippets around keyword hits."""
+        if self._use_full_text(full_text):
+            return self._format_node(node)
+        return self._format_node(
+            node, extract_snippet(node["text"], keywords, self.snippet_chars, self.snippet_window)
+        )
+
+    def _log_top_nodes(self, top_hits: list[tuple[int, float]], match_count: int) -> None:
+        logger.info(f"Ziwei RAG found {match_count} matching nodes, returning top {len(top_hits)}")
+
+        for i, (doc_id, score) in enumerate(top_hits):
+            node = self._all_nodes[doc_id]
+            logger.info(f"Ziwei Node {i+1} [score: {score:.2f}, title: {node['title']}]:")
+            logger.info(f"Content: {node['text'][:200]}...")
+
+    @traced("ziwei.search_context")
+    def search_context(self, query: str, max_results: int = 3, full_text: bool = False) -> str:
         """
-        Search the knowledge base for relevant ancient texts using keyword matching.
+        Search the knowledge base for relevant ancient texts using BM25 keyword scoring.
 
         Args:
             query: The search query (e.g., "命宫 紫微星")
             max_results: Maximum number of text excerpts to return
+            full_text: Return whole node texts instead of keyword snippets
 
         Returns:
             Formatted string with relevant ancient text excerpts
@@ -76,38 +155,120 @@ class ZiweiRAGService:
             return ""
 
         # Extract keywords from query
-        keywords = [k.strip() for k in query.replace("紫微斗数", "").split() if k.strip()]
+        keywords = self._extract_keywords(query)
+        cache_key = self._cache_key(keywords, max_results, full_text)
+        cached = self._result_cache.get(cache_key)
+        record_cache("ziwei_search", cached is not None)
+        set_span_attributes(keywords=len(keywords), cache_hit=cached is not None)
+        if cached is not None:
+            logger.info(f"Ziwei RAG cache hit for keywords: {keywords}")
+            return cached[0]
+
         logger.info(f"Ziwei RAG searching for keywords: {keywords}")
 
-        # Score each node by keyword matches
-        scored_nodes = []
-        for node in self._all_nodes:
-            score = 0
-            text_lower = (node["text"] + node["title"] + node.get("summary", "")).lower()
-            for keyword in keywords:
-                if keyword.lower() in text_lower:
-                    score += text_lower.count(keyword.lower())
-            if score > 0:
-                scored_nodes.append((score, node))
-
-        # Sort by score and take top results
-        scored_nodes.sort(key=lambda x: x[0], reverse=True)
-        top_nodes = scored_nodes[:max_results]
-
-        logger.info(f"Ziwei RAG found {len(scored_nodes)} matching nodes, returning top {len(top_nodes)}")
-
-        for i, (score, node) in enumerate(top_nodes):
-            logger.info(f"Ziwei Node {i+1} [score: {score}, title: {node['title']}]:")
-            logger.info(f"Content: {node['text'][:200]}...")
+        # Score only the nodes found in the posting lists of the query terms
+        with STAGE_SECONDS.time(stage="ziwei_search"):
+            top_hits, match_count = self._search_index.search(keywords, max_results)
+        self._log_top_nodes(top_hits, match_count)
 
-        if not top_nodes:
+        if not top_hits:
             logger.warning("No matching nodes found for query")
+            self._result_cache.put(cache_key, ("", 0))
             return ""
 
         # Format results
-        texts = [f"### {node['title']}\n{node['text']}" for _, node in top_nodes]
-        result = "\n\n".join(texts)
+        nodes = [self._all_nodes[doc_id] for doc_id, _ in top_hits]
+        result = "\n\n".join(self._format_passage(node, keywords, full_text) for node in nodes)
+        full_length = len("\n\n".join(self._format_node(node) for node in nodes))
 
-        logger.info(f"Total Ziwei retrieved context length: {len(result)} characters")
+        logger.info(
+            f"Total Ziwei retrieved context length: {len(result)} characters "
+            f"(full text {full_length})"
+        )
 
+        self._result_cache.put(cache_key, (result, full_length))
+        set_span_attributes(passages=len(nodes), context_chars=len(result))
         return result
+
+    @traced("ziwei.search_many")
+    def search_many(
+        self, queries: list[str], max_results: int = 3, full_text: bool = False
+    ) -> list[str]:
+        """
+        Search the knowledge base for several queries at once.
+
+        All queries are scored in a single walk over the index, and passages
+        shared between queries are decoded and formatted only once.
+
+        Args:
+            queries: Search queries, e.g. one per palace
+            max_results: Maximum number of text excerpts per query
+            full_text: Return whole node texts instead of keyword snippets
+
+        Returns:
+            Formatted context strings, in the same order as queries
+        """
+        self._load_index()
+
+        if not self._all_nodes:
+            logger.warning("No nodes loaded, returning empty context")
+            return ["" for _ in queries]
+
+        keyword_lists = [self._extract_keywords(query) for query in queries]
+        cache_keys = [self._cache_key(keywords, max_results, full_text) for keywords in keyword_lists]
+        entries: list[tuple[str, int] | None] = [self._result_cache.get(key) for key in cache_keys]
+
+        # Only the queries that missed the cache are scored, still in one walk
+        pending = [i for i, entry in enumerate(entries) if entry is None]
+        for entry in entries:
+            record_cache("ziwei_search", entry is not None)
+        logger.info(
+            f"Ziwei RAG batch searching {len(pending)} of {len(queries)} queries "
+            f"({len(queries) - len(pending)} cached)"
+        )
+
+        nodes: dict[int, dict[str, Any]] = {}
+        full_passages: dict[int, str] = {}
+        with STAGE_SECONDS.time(stage="ziwei_search_batch"):
+            pending_hits = self._search_index.search_many(
+                [keyword_lists[i] for i in pending], max_results
+            )
+        for i, (top_hits, match_count) in zip(pending, pending_hits):
+            keywords = keyword_lists[i]
+            logger.info(f"Ziwei RAG keywords: {keywords}")
+            self._log_top_nodes(top_hits, match_count)
+            for doc_id, _ in top_hits:
+                if doc_id not in nodes:
+                    nodes[doc_id] = self._all_nodes[doc_id]
+                    full_passages[doc_id] = self._format_node(nodes[doc_id])
+            doc_ids = [doc_id for doc_id, _ in top_hits]
+            if self._use_full_text(full_text):
+                result = "\n\n".join(full_passages[doc_id] for doc_id in doc_ids)
+            else:
+                # Snippets depend on the query's keywords, so they are cut per query
+                result = "\n\n".join(
+                    self._format_passage(nodes[doc_id], keywords, full_text) for doc_id in doc_ids
+                )
+            entries[i] = (result, len("\n\n".join(full_passages[doc_id] for doc_id in doc_ids)))
+            self._result_cache.put(cache_keys[i], entries[i])
+
+        results = [result for result, _ in entries]
+        returned = sum(len(result) for result in results)
+        full = sum(full_length for _, full_length in entries)
+        set_span_attributes(
+            queries=len(queries),
+            cached=len(queries) - len(pending),
+            passages=len(nodes),
+            context_chars=returned,
+        )
+        logger.info(
+            f"Ziwei RAG batch returned {len(nodes)} distinct new passages for {len(queries)} queries, "
+            f"total context length: {returned} characters"
+        )
+        if full and not self._use_full_text(full_text):
+            logger.info(
+                f"Ziwei RAG snippets cut batch context from {full} to {returned} characters "
+                f"({100 * (1 - returned / full):.1f}% smaller)"
+            )
+
+        return results
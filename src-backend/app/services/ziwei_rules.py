@@ -8,6 +8,30 @@ from typing import Any
 # Ten Heavenly Stems
 HEAVENLY_STEMS = ["甲", "乙", "丙", "丁", "戊", "己", "庚", "辛", "壬", "癸"]
 
+# Twelve palace names as produced by the astrolabe (iztro, zh-CN)
+PALACE_NAMES = [
+    "命宫", "兄弟", "夫妻", "子女", "财帛", "疾厄",
+    "迁移", "仆役", "官禄", "田宅", "福德", "父母",
+]
+
+# Star names as produced by the astrolabe: 14 major, 14 minor and the adjective stars
+MAJOR_STAR_NAMES = [
+    "紫微", "天机", "太阳", "武曲", "天同", "廉贞", "天府",
+    "太阴", "贪狼", "巨门", "天相", "天梁", "七杀", "破军",
+]
+MINOR_STAR_NAMES = [
+    "左辅", "右弼", "文昌", "文曲", "天魁", "天钺", "禄存",
+    "天马", "擎羊", "陀罗", "火星", "铃星", "地空", "地劫",
+]
+ADJECTIVE_STAR_NAMES = [
+    "天官", "天福", "天厨", "天刑", "天姚", "解神", "天巫", "天月",
+    "阴煞", "台辅", "封诰", "天空", "天哭", "天虚", "龙池", "凤阁",
+    "红鸾", "天喜", "孤辰", "寡宿", "蜚廉", "破碎", "华盖", "咸池",
+    "天德", "月德", "天才", "天寿", "三台", "八座", "恩光", "天贵",
+    "天伤", "天使", "截路", "空亡", "旬空", "旬中", "截空",
+]
+STAR_NAMES = [*MAJOR_STAR_NAMES, *MINOR_STAR_NAMES, *ADJECTIVE_STAR_NAMES]
+
 # Mutagen Rules (sihua) - Maps heavenly stem to star transformations
 # Format: "star->transformation, ..."
 # Transformations: 禄 (Wealth/Lu), 权 (Authority/Quan), 科 (Fame/Ke), 忌 (Obstruction/Ji)
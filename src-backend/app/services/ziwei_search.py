@@ -0,0 +1,202 @@
+"""
+Inverted index for the Ziwei knowledge base.
+Scores nodes with BM25 over character n-grams so a query only touches the
+posting lists of its own terms instead of scanning every node. Keywords longer
+than an n-gram are counted exactly with an Aho-Corasick pass over the few
+candidate nodes that contain all of their n-grams.
+"""
+
+import heapq
+import math
+from collections import Counter, defaultdict
+from collections.abc import Iterator, Sequence
+from typing import Any
+
+from app.services.ziwei_matcher import AhoCorasick, vocabulary_matcher
+
+# Classical Chinese has no word boundaries, so nodes are indexed by character
+# unigrams and bigrams. Star and palace names are mostly two characters long,
+# which makes the bigram posting list an exact occurrence count for them.
+NGRAM_SIZES = (1, 2)
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def node_search_text(node: dict[str, Any]) -> str:
+    """Return the lowercased text of a node that the index is built over."""
+    return "\n".join(
+        (node.get("text", ""), node.get("title", ""), node.get("summary", ""))
+    ).lower()
+
+
+def extract_ngrams(text: str, size: int) -> list[str]:
+    """Return all character n-grams of the given size, skipping whitespace."""
+    return [
+        text[i : i + size]
+        for i in range(len(text) - size + 1)
+        if not any(ch.isspace() for ch in text[i : i + size])
+    ]
+
+
+def keyword_terms(keyword: str) -> list[str]:
+    """Split a keyword into the n-gram terms it is indexed under."""
+    keyword = keyword.lower()
+    size = max(NGRAM_SIZES)
+    if len(keyword) <= size:
+        return [keyword]
+    return extract_ngrams(keyword, size)
+
+
+class ZiweiSearchIndex:
+    """
+    Character n-gram inverted index with BM25 scoring.
+    Built once per knowledge base load; searches are read-only.
+    """
+
+    def __init__(self, nodes: Sequence[dict[str, Any]]):
+        postings: dict[str, list[tuple[int, int]]] = defaultdict(list)
+        self._doc_lengths: list[int] = []
+        self.nodes = nodes
+
+        # Palace and star names longer than an n-gram get exact phrase postings
+        vocabulary = vocabulary_matcher()
+        max_ngram = max(NGRAM_SIZES)
+
+        for doc_id, node in enumerate(nodes):
+            text = node_search_text(node)
+            self._doc_lengths.append(len(text))
+
+            term_counts: Counter[str] = Counter()
+            for size in NGRAM_SIZES:
+                term_counts.update(extract_ngrams(text, size))
+            for phrase, count in vocabulary.count(text).items():
+                if len(phrase) > max_ngram:
+                    term_counts[phrase] = count
+            for term, count in term_counts.items():
+                postings[term].append((doc_id, count))
+
+        self._postings: dict[str, list[tuple[int, int]]] = dict(postings)
+        self._avg_length = (
+            sum(self._doc_lengths) / len(self._doc_lengths) if self._doc_lengths else 0.0
+        )
+
+    @property
+    def num_docs(self) -> int:
+        return len(self._doc_lengths)
+
+    @property
+    def num_terms(self) -> int:
+        return len(self._postings)
+
+    def postings(self, term: str) -> list[tuple[int, int]]:
+        """Return (doc_id, term_frequency) pairs for a term."""
+        return self._postings.get(term, [])
+
+    def iter_terms(self) -> Iterator[tuple[str, list[tuple[int, int]]]]:
+        """Iterate over (term, postings) pairs, used when compiling a snapshot."""
+        return iter(self._postings.items())
+
+    def doc_length(self, doc_id: int) -> int:
+        return self._doc_lengths[doc_id]
+
+    def _idf(self, doc_freq: int) -> float:
+        return math.log(1 + (self.num_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+
+    def _match_phrases(self, phrases: list[str]) -> dict[str, list[tuple[int, int]]]:
+        """
+        Count phrases that have no posting list of their own.
+        Candidates are the nodes containing every n-gram of a phrase; each
+        candidate is scanned once for all phrases together.
+        """
+        candidates: dict[str, set[int]] = {}
+        for phrase in phrases:
+            doc_ids: set[int] | None = None
+            for term in keyword_terms(phrase):
+                term_docs = {doc_id for doc_id, _ in self.postings(term)}
+                doc_ids = term_docs if doc_ids is None else doc_ids & term_docs
+                if not doc_ids:
+                    break
+            candidates[phrase] = doc_ids or set()
+
+        matched: dict[str, list[tuple[int, int]]] = {phrase: [] for phrase in phrases}
+        matcher = AhoCorasick(phrases)
+        for doc_id in sorted(set().union(*candidates.values())):
+            for phrase, count in matcher.count(node_search_text(self.nodes[doc_id])).items():
+                matched[phrase].append((doc_id, count))
+        return matched
+
+    def keyword_postings(self, keywords: list[str]) -> dict[str, list[tuple[int, int]]]:
+        """Resolve each query keyword to exact (doc_id, occurrence_count) postings."""
+        resolved: dict[str, list[tuple[int, int]]] = {}
+        unresolved: list[str] = []
+        for keyword in dict.fromkeys(k.lower() for k in keywords if k):
+            keyword_postings = self.postings(keyword)
+            if keyword_postings or len(keyword) <= max(NGRAM_SIZES):
+                resolved[keyword] = keyword_postings
+            else:
+                unresolved.append(keyword)
+
+        if unresolved:
+            resolved.update(self._match_phrases(unresolved))
+        return resolved
+
+    def _keyword_weights(
+        self, keyword_postings: dict[str, list[tuple[int, int]]]
+    ) -> dict[str, list[tuple[int, float]]]:
+        """Turn each keyword's postings into per-node BM25 contributions."""
+        weights: dict[str, list[tuple[int, float]]] = {}
+        for keyword, term_postings in keyword_postings.items():
+            if not term_postings:
+                weights[keyword] = []
+                continue
+            idf = self._idf(len(term_postings))
+            weights[keyword] = [
+                (
+                    doc_id,
+                    idf * tf * (BM25_K1 + 1)
+                    / (tf + BM25_K1 * (1 - BM25_B + BM25_B * self.doc_length(doc_id) / self._avg_length)),
+                )
+                for doc_id, tf in term_postings
+            ]
+        return weights
+
+    def score(self, keywords: list[str]) -> dict[int, float]:
+        """Accumulate BM25 scores for every node that contains a query keyword."""
+        return self.score_many([keywords])[0]
+
+    def score_many(self, keyword_lists: list[list[str]]) -> list[dict[int, float]]:
+        """
+        Score several queries in one walk over the index.
+        Keywords shared between queries are resolved and weighted only once.
+        """
+        if not self.num_docs:
+            return [{} for _ in keyword_lists]
+
+        all_keywords = [keyword for keywords in keyword_lists for keyword in keywords]
+        weights = self._keyword_weights(self.keyword_postings(all_keywords))
+
+        results: list[dict[int, float]] = []
+        for keywords in keyword_lists:
+            scores: dict[int, float] = defaultdict(float)
+            for keyword in dict.fromkeys(k.lower() for k in keywords if k):
+                for doc_id, weight in weights[keyword]:
+                    scores[doc_id] += weight
+            results.append(scores)
+        return results
+
+    def search(self, keywords: list[str], max_results: int) -> tuple[list[tuple[int, float]], int]:
+        """
+        Return the top-k (doc_id, score) pairs and the total number of matching nodes.
+        """
+        return self.search_many([keywords], max_results)[0]
+
+    def search_many(
+        self, keyword_lists: list[list[str]], max_results: int
+    ) -> list[tuple[list[tuple[int, float]], int]]:
+        """Run search() for several queries that share one index walk."""
+        return [
+            (heapq.nlargest(max_results, scores.items(), key=lambda item: item[1]), len(scores))
+            for scores in self.score_many(keyword_lists)
+        ]
@@ -0,0 +1,273 @@
+"""
+Precompiled binary snapshot of the Ziwei knowledge base.
+
+The snapshot holds the flattened nodes as one UTF-8 text blob with offset
+tables, plus the prebuilt n-gram search index. Workers mmap the file, so the
+pages are shared through the OS page cache and cold start skips JSON parsing,
+flattening and index construction.
+
+Build it offline after editing ziwei_index.json or the palace and star
+vocabulary in ziwei_rules:
+
+    python -m app.services.ziwei_snapshot
+"""
+
+import hashlib
+import json
+import logging
+import mmap
+import struct
+import sys
+from array import array
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Any
+
+from app.services.ziwei_matcher import vocabulary
+from app.services.ziwei_search import NGRAM_SIZES, ZiweiSearchIndex
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"XUANZWSN"
+VERSION = 1
+
+# All integers are little-endian.
+# magic, version, node count, term count, source sha256,
+# then byte offsets of: node table, doc lengths, term table, postings, term blob, text blob
+HEADER = struct.Struct("<8sIII32s6I")
+
+# Per node: (offset, length) into the text blob for each field
+NODE_FIELDS = ("title", "node_id", "text", "summary")
+# Per term: term blob offset, term byte length, first posting, posting count
+TERM_ENTRY_WIDTH = 4
+
+
+def source_digest(source_path: Path) -> bytes:
+    """
+    Return the sha256 digest of everything the snapshot is built from: the
+    JSON knowledge base, the n-gram sizes and the phrase vocabulary.
+    """
+    digest = hashlib.sha256(source_path.read_bytes())
+    digest.update(repr(NGRAM_SIZES).encode("utf-8"))
+    digest.update("\0".join(sorted(vocabulary())).encode("utf-8"))
+    return digest.digest()
+
+
+def flatten_nodes(nodes: list[dict[str, Any]], out: list[dict[str, Any]]) -> None:
+    """Recursively flatten nodes that carry text into a flat list."""
+    for node in nodes:
+        if node.get("text"):
+            out.append({
+                "title": node.get("title", ""),
+                "node_id": node.get("node_id", ""),
+                "text": node.get("text", ""),
+                "summary": node.get("summary", ""),
+            })
+        if node.get("nodes"):
+            flatten_nodes(node["nodes"], out)
+
+
+def compile_snapshot(
+    nodes: list[dict[str, Any]],
+    search_index: ZiweiSearchIndex,
+    digest: bytes,
+) -> bytes:
+    """Serialize flattened nodes and their search index into the snapshot format."""
+    text_blob = bytearray()
+    node_table: list[int] = []
+    for node in nodes:
+        for field in NODE_FIELDS:
+            encoded = node.get(field, "").encode("utf-8")
+            node_table.extend((len(text_blob), len(encoded)))
+            text_blob += encoded
+
+    doc_lengths = [search_index.doc_length(doc_id) for doc_id in range(search_index.num_docs)]
+
+    # Terms are sorted by their UTF-8 bytes so the reader can binary search them
+    encoded_terms = sorted(
+        (term.encode("utf-8"), term_postings)
+        for term, term_postings in search_index.iter_terms()
+    )
+    term_blob = bytearray()
+    term_table: list[int] = []
+    postings: list[int] = []
+    for encoded, term_postings in encoded_terms:
+        term_table.extend((len(term_blob), len(encoded), len(postings) // 2, len(term_postings)))
+        term_blob += encoded
+        for doc_id, tf in term_postings:
+            postings.extend((doc_id, tf))
+
+    sections = [
+        struct.pack(f"<{len(node_table)}I", *node_table),
+        struct.pack(f"<{len(doc_lengths)}I", *doc_lengths),
+        struct.pack(f"<{len(term_table)}I", *term_table),
+        struct.pack(f"<{len(postings)}I", *postings),
+        bytes(term_blob),
+        bytes(text_blob),
+    ]
+    offsets = []
+    position = HEADER.size
+    for section in sections:
+        offsets.append(position)
+        position += len(section)
+
+    header = HEADER.pack(MAGIC, VERSION, len(nodes), len(encoded_terms), digest, *offsets)
+    return header + b"".join(sections)
+
+
+def build_snapshot(source_path: Path, snapshot_path: Path) -> None:
+    """Compile the JSON knowledge base at source_path into snapshot_path."""
+    with open(source_path, encoding="utf-8") as f:
+        index_data = json.load(f)
+
+    nodes: list[dict[str, Any]] = []
+    flatten_nodes(index_data.get("structure", []), nodes)
+    payload = compile_snapshot(nodes, ZiweiSearchIndex(nodes), source_digest(source_path))
+
+    # Write next to the target and rename so running workers never see a partial file
+    tmp_path = snapshot_path.with_suffix(snapshot_path.suffix + ".tmp")
+    tmp_path.write_bytes(payload)
+    tmp_path.replace(snapshot_path)
+    logger.info(f"Wrote Ziwei snapshot with {len(nodes)} nodes ({len(payload)} bytes) to {snapshot_path}")
+
+
+class SnapshotNodes(Sequence):
+    """Read-only node list that decodes fields from the text blob on access."""
+
+    def __init__(self, buffer: memoryview, node_table: Sequence[int], text_offset: int, count: int):
+        self._buffer = buffer
+        self._node_table = node_table
+        self._text_offset = text_offset
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("node index out of range")
+
+        node: dict[str, str] = {}
+        base = index * len(NODE_FIELDS) * 2
+        for i, field in enumerate(NODE_FIELDS):
+            start = self._text_offset + self._node_table[base + 2 * i]
+            length = self._node_table[base + 2 * i + 1]
+            node[field] = str(self._buffer[start : start + length], "utf-8")
+        return node
+
+
+class ZiweiSnapshot(ZiweiSearchIndex):
+    """
+    Search index and node table backed by a snapshot buffer.
+    Postings and node text are read straight from the (usually mmapped) buffer.
+    """
+
+    def __init__(self, buffer: bytes | mmap.mmap):
+        view = memoryview(buffer)
+        (
+            magic,
+            version,
+            node_count,
+            term_count,
+            self.digest,
+            node_table_offset,
+            doc_lengths_offset,
+            term_table_offset,
+            postings_offset,
+            term_blob_offset,
+            text_blob_offset,
+        ) = HEADER.unpack_from(view)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a Ziwei snapshot or unsupported snapshot version")
+
+        def uint32_section(start: int, count: int) -> Sequence[int]:
+            section = view[start : start + count * 4]
+            if sys.byteorder == "little":
+                # The native layout matches the file, read it in place
+                return section.cast("I")
+            values = array("I", section.tobytes())
+            values.byteswap()
+            return values
+
+        self._buffer = buffer
+        self._term_count = term_count
+        self._term_blob = view[term_blob_offset:text_blob_offset]
+        self._term_table = uint32_section(term_table_offset, term_count * TERM_ENTRY_WIDTH)
+        self._postings_table = uint32_section(postings_offset, (term_blob_offset - postings_offset) // 4)
+        self._doc_lengths = uint32_section(doc_lengths_offset, node_count)
+        self._avg_length = sum(self._doc_lengths) / node_count if node_count else 0.0
+        self.nodes = SnapshotNodes(
+            view,
+            uint32_section(node_table_offset, node_count * len(NODE_FIELDS) * 2),
+            text_blob_offset,
+            node_count,
+        )
+
+    @property
+    def num_terms(self) -> int:
+        return self._term_count
+
+    def _term_at(self, position: int) -> bytes:
+        entry = position * TERM_ENTRY_WIDTH
+        start = self._term_table[entry]
+        return self._term_blob[start : start + self._term_table[entry + 1]].tobytes()
+
+    def postings(self, term: str) -> list[tuple[int, int]]:
+        encoded = term.encode("utf-8")
+        low, high = 0, self._term_count
+        while low < high:
+            mid = (low + high) // 2
+            if self._term_at(mid) < encoded:
+                low = mid + 1
+            else:
+                high = mid
+        if low == self._term_count or self._term_at(low) != encoded:
+            return []
+
+        entry = low * TERM_ENTRY_WIDTH
+        first = self._term_table[entry + 2]
+        count = self._term_table[entry + 3]
+        pairs = self._postings_table[2 * first : 2 * (first + count)].tolist()
+        return list(zip(pairs[0::2], pairs[1::2]))
+
+    def iter_terms(self):
+        for position in range(self._term_count):
+            term = self._term_at(position).decode("utf-8")
+            yield term, self.postings(term)
+
+
+def load_snapshot(snapshot_path: Path, source_path: Path) -> ZiweiSnapshot | None:
+    """
+    Memory-map the snapshot if it exists and matches the JSON source.
+    Returns None when the caller should fall back to parsing the JSON.
+    """
+    if not snapshot_path.exists():
+        return None
+
+    try:
+        with open(snapshot_path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        snapshot = ZiweiSnapshot(buffer)
+    except (OSError, ValueError, struct.error) as e:
+        logger.warning(f"Ignoring unreadable Ziwei snapshot {snapshot_path}: {e}")
+        return None
+
+    if source_path.exists() and snapshot.digest != source_digest(source_path):
+        logger.warning(
+            f"Ziwei snapshot {snapshot_path} is stale; rebuild it with "
+            "`python -m app.services.ziwei_snapshot`"
+        )
+        return None
+
+    return snapshot
+
+
+if __name__ == "__main__":
+    from app.services.ziwei_rag import ZIWEI_INDEX_PATH, ZIWEI_SNAPSHOT_PATH
+
+    logging.basicConfig(level=logging.INFO)
+    build_snapshot(ZIWEI_INDEX_PATH, ZIWEI_SNAPSHOT_PATH)
@@ -0,0 +1,111 @@
+"""
+Query-focused snippet extraction for Ziwei passages.
+Cuts a long node down to the sentences around its keyword hits so palace
+prompts carry the relevant lines of a chapter instead of the whole chapter.
+"""
+
+from app.services.ziwei_matcher import AhoCorasick
+
+# Sentence-ending punctuation that windows snap to
+SENTENCE_ENDS = frozenset("。！？；\n")
+# Marks text left out between two snippets
+ELLIPSIS = "……"
+
+
+def _sentence_start(text: str, position: int, limit: int) -> int:
+    """Move position back to just after the previous sentence end, at most limit characters."""
+    floor = max(position - limit, 0)
+    for i in range(position, floor, -1):
+        if text[i - 1] in SENTENCE_ENDS:
+            return i
+    return floor
+
+
+def _sentence_end(text: str, position: int, limit: int) -> int:
+    """Move position forward to just after the next sentence end, at most limit characters."""
+    stop = min(position + limit, len(text))
+    for i in range(position, stop):
+        if text[i] in SENTENCE_ENDS:
+            return i + 1
+    return stop
+
+
+def hit_windows(text: str, keywords: list[str], window: int) -> list[tuple[int, int, frozenset[str]]]:
+    """
+    Return a (start, end, keywords inside) window around every keyword hit.
+    Each hit is widened by window characters on both sides and snapped
+    outwards to sentence boundaries.
+    """
+    matcher = AhoCorasick(k.lower() for k in keywords)
+    haystack = text.lower()
+    if len(haystack) != len(text):
+        haystack = text
+
+    hits = list(matcher.iter_matches(haystack))
+    spans = {
+        (
+            _sentence_start(text, max(start - window, 0), window),
+            _sentence_end(text, min(start + len(keyword) + window, len(text)), window),
+        )
+        for start, keyword in hits
+    }
+    return sorted(
+        (
+            start,
+            end,
+            frozenset(k for pos, k in hits if start <= pos and pos + len(k) <= end),
+        )
+        for start, end in spans
+    )
+
+
+def merge_spans(spans: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    """Merge overlapping or touching (start, end) spans."""
+    merged: list[tuple[int, int]] = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def extract_snippet(text: str, keywords: list[str], max_chars: int, window: int = 60) -> str:
+    """
+    Return the parts of text around keyword hits, within max_chars characters.
+
+    Windows are picked greedily, preferring those that add keywords not yet
+    covered and then earlier ones; overlapping picks are merged and joined in
+    document order. Text that already fits is returned whole, and text without
+    hits is cut at max_chars.
+    """
+    if len(text) <= max_chars:
+        return text
+
+    candidates = hit_windows(text, keywords, window)
+    if not candidates:
+        return text[:max_chars] + ELLIPSIS
+
+    picked: list[tuple[int, int]] = []
+    covered: set[str] = set()
+    used = 0
+    while candidates:
+        best = max(candidates, key=lambda w: (len(w[2] - covered), len(w[2]), -w[0]))
+        candidates.remove(best)
+        start, end, found = best
+        merged = merge_spans([*picked, (start, end)])
+        cost = sum(e - s for s, e in merged) - used
+        if used + cost > max_chars:
+            continue
+        picked, used = merged, used + cost
+        covered |= found
+
+    if not picked:
+        # Even the best window alone is too long; keep its head
+        start = max(hit_windows(text, keywords, window), key=lambda w: len(w[2]))[0]
+        picked = [(start, min(start + max_chars, len(text)))]
+
+    parts = [text[start:end].strip() for start, end in picked]
+    prefix = ELLIPSIS if picked[0][0] > 0 else ""
+    suffix = ELLIPSIS if picked[-1][1] < len(text) else ""
+    return prefix + ELLIPSIS.join(parts) + suffix
@@ -0,0 +1,114 @@
+"""Benchmark script for the RAG API endpoints."""
+
+import asyncio
+import random
+import statistics
+import time
+
+import httpx
+from qdrant_client import AsyncQdrantClient
+
+BASE_URL = "http://localhost:8000"
+
+STREAM_PAYLOAD = {
+    "prompt": "What is this document about?",
+    "user_context": "I am a developer benchmarking the API",
+    "top_k": 3,
+}
+
+
+async def time_to_first_token(client: httpx.AsyncClient) -> float:
+    """Open one /query/stream connection and return seconds until the first token event."""
+    start = time.perf_counter()
+    async with client.stream(
+        "POST", f"{BASE_URL}/query/stream", json=STREAM_PAYLOAD, timeout=120.0
+    ) as response:
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event:"):
+                event = line[6:].strip()
+            elif line.startswith("data:") and event == "token":
+                return time.perf_counter() - start
+            elif event == "error":
+                raise RuntimeError(f"Stream failed: {line}")
+    raise RuntimeError("Stream ended without a token")
+
+
+def bench_stream_ttft(levels: tuple[int, ...] = (1, 2, 4, 8, 16)):
+    """
+    Measure per-stream time-to-first-token with N parallel /query/stream connections.
+    With non-blocking streaming the TTFT should stay roughly flat as N grows.
+    """
+    print("Benchmarking /query/stream time-to-first-token...")
+
+    async def run(parallel: int) -> list[float]:
+        limits = httpx.Limits(max_connections=parallel)
+        async with httpx.AsyncClient(limits=limits) as client:
+            return await asyncio.gather(*(time_to_first_token(client) for _ in range(parallel)))
+
+    for parallel in levels:
+        ttfts = asyncio.run(run(parallel))
+        print(
+            f"N={parallel:>3}  median TTFT {statistics.median(ttfts):.3f}s  "
+            f"max {max(ttfts):.3f}s"
+        )
+    print()
+
+
+def bench_qdrant_transport(
+    top_k_values: tuple[int, ...] = (3, 5, 10),
+    iterations: int = 50,
+    parallel: int = 8,
+):
+    """
+    Compare Qdrant search latency over REST and gRPC with the app's client settings.
+    Talks to Qdrant directly, using the QDRANT_* values from .env.
+    """
+    from app.config import get_settings
+    from app.core.dependencies import get_ingestion_service
+
+    print("Benchmarking Qdrant search latency (REST vs gRPC)...")
+    settings = get_settings()
+    kwargs = get_ingestion_service().qdrant_client_kwargs()
+
+    async def run(prefer_grpc: bool, top_k: int) -> list[float]:
+        client = AsyncQdrantClient(**{**kwargs, "prefer_grpc": prefer_grpc})
+        collection = await client.get_collection(settings.qdrant_collection_name)
+        vectors = collection.config.params.vectors
+        # Hybrid collections use named dense vectors
+        using, params = (None, vectors) if hasattr(vectors, "size") else next(iter(vectors.items()))
+        semaphore = asyncio.Semaphore(parallel)
+
+        async def one() -> float:
+            query = [random.uniform(-1, 1) for _ in range(params.size)]
+            async with semaphore:
+                start = time.perf_counter()
+                await client.query_points(
+                    settings.qdrant_collection_name, query=query, using=using, limit=top_k
+                )
+                return time.perf_counter() - start
+
+        await one()  # Warm up the connection
+        latencies = await asyncio.gather(*(one() for _ in range(iterations)))
+        await client.close()
+        return latencies
+
+    for top_k in top_k_values:
+        for prefer_grpc in (False, True):
+            latencies = sorted(asyncio.run(run(prefer_grpc, top_k)))
+            p95 = latencies[int(0.95 * (len(latencies) - 1))]
+            print(
+                f"{'gRPC' if prefer_grpc else 'REST':<4}  top_k={top_k:>2}  "
+                f"median {1000 * statistics.median(latencies):.1f}ms  p95 {1000 * p95:.1f}ms"
+            )
+    print()
+
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("RAG API Benchmark Script")
+    print("=" * 50 + "\n")
+
+    bench_stream_ttft()
+
+    bench_qdrant_transport()
@@ -1,12 +1,20 @@
+import logging
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 
 from app.config import get_settings
-from app.core.dependencies import get_ingestion_service, get_llm_service
-from app.models.responses import HealthResponse
-from app.routers import ingest, meiwen, query, ziwei
+from app.core.dependencies import get_health_monitor, get_ingestion_job_manager, get_llm_service
+from app.core.disconnect import ClientDisconnected
+from app.core.metrics import CONTENT_TYPE, REGISTRY
+from app.core.tracing import TracingMiddleware, get_tracer
+from app.models.responses import DependencyHealth, HealthResponse, LLMQueueStats
+from app.routers import debug, ingest, meiwen, query, ziwei
+from app.services.llm_scheduler import LLMOverloadedError
+
+logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
@@ -14,9 +22,20 @@ async def lifespan(app: FastAPI):
     """Application lifespan handler for startup/shutdown."""
     llm_service = get_llm_service()
     llm_service.configure_global_settings()
+    health_monitor = get_health_monitor()
+    health_monitor.start()
+    get_ingestion_job_manager().recover()
 
     yield
 
+    await health_monitor.stop()
+    get_ingestion_job_manager().shutdown()
+    get_tracer().shutdown()
+
+    embedding_cache_stats = llm_service.embedding_cache_stats()
+    if embedding_cache_stats:
+        logger.info(f"Query-embedding cache stats: {embedding_cache_stats}")
+
 
 app = FastAPI(
     title="Xuan RAG Backend",
@@ -31,28 +50,87 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id"],
 )
+app.add_middleware(TracingMiddleware)
 
 app.include_router(query.router)
 app.include_router(ingest.router)
 app.include_router(ziwei.router)
 app.include_router(meiwen.router)
+app.include_router(debug.router)
 
 
-@app.get("/", response_model=HealthResponse)
-async def health_check():
-    """Health check endpoint."""
-    ingestion_service = get_ingestion_service()
+@app.exception_handler(LLMOverloadedError)
+async def llm_overloaded_handler(request: Request, exc: LLMOverloadedError):
+    """Shed load with 503 and a Retry-After hint when the LLM scheduler is saturated."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(ClientDisconnected)
+async def client_disconnected_handler(request: Request, exc: ClientDisconnected):
+    """Nobody is listening any more; 499 only shows up in access logs."""
+    return Response(status_code=499)
+
+
+def llm_queue_stats() -> LLMQueueStats:
+    llm_service = get_llm_service()
+    coalescer = llm_service.coalescer
+    return LLMQueueStats(
+        **llm_service.scheduler.stats(),
+        coalesced=coalescer.coalesced if coalescer is not None else 0,
+    )
+
+
+def build_health_response(include_dependencies: bool) -> HealthResponse:
+    """Build a health response from the monitor's cached probe results."""
+    monitor = get_health_monitor()
     settings = get_settings()
+    results = monitor.results
+
+    if not results:
+        status = "starting"
+    elif all(result.ok for result in results.values()):
+        status = "healthy"
+    else:
+        status = "degraded"
 
     return HealthResponse(
-        status="healthy",
-        qdrant_connected=ingestion_service.check_connection(),
+        status=status,
+        qdrant_connected=monitor.is_ok("qdrant"),
         llm_configured=bool(settings.llm_api_base and settings.llm_api_key),
+        checked_at=min((result.checked_at for result in results.values()), default=None),
+        dependencies=(
+            {name: DependencyHealth(**vars(result)) for name, result in results.items()}
+            if include_dependencies
+            else None
+        ),
+        llm_queue=llm_queue_stats() if include_dependencies else None,
     )
 
 
+@app.get("/", response_model=HealthResponse)
+async def health_check():
+    """Health check endpoint, served from the background monitor's cache."""
+    return build_health_response(include_dependencies=False)
+
+
 @app.get("/health", response_model=HealthResponse)
-async def detailed_health():
-    """Detailed health check."""
-    return await health_check()
+async def detailed_health(deep: bool = False):
+    """
+    Detailed health check with per-dependency status and latency.
+    With deep=true all dependencies are probed now instead of read from cache.
+    """
+    if deep:
+        await get_health_monitor().refresh()
+    return build_health_response(include_dependencies=True)
+
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    """Pipeline metrics in the Prometheus text exposition format."""
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
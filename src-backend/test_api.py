@@ -1,5 +1,8 @@
 """Test script for the RAG API endpoints."""
 
+import asyncio
+import time
+
 import httpx
 
 BASE_URL = "http://localhost:8000"
@@ -10,7 +13,12 @@ def test_health():
     print("Testing health endpoint...")
     response = httpx.get(f"{BASE_URL}/health")
     print(f"Status: {response.status_code}")
-    print(f"Response: {response.json()}\n")
+    print(f"Response: {response.json()}")
+
+    response = httpx.get(f"{BASE_URL}/health", params={"deep": True}, timeout=30.0)
+    for name, dependency in response.json()["dependencies"].items():
+        print(f"  {name}: ok={dependency['ok']} latency={dependency['latency_ms']:.1f}ms")
+    print()
 
 
 def test_query_sync():
@@ -29,6 +37,36 @@ def test_query_sync():
     print(f"Response: {response.json()}\n")
 
 
+def test_query_concurrent():
+    """Test that two concurrent /query/ calls are served in parallel, not one after another."""
+    print("Testing concurrent /query/ requests...")
+    payload = {
+        "prompt": "What is this document about?",
+        "user_context": "I am a developer testing the API",
+        "top_k": 3,
+    }
+
+    async def timed_query(client: httpx.AsyncClient) -> float:
+        start = time.perf_counter()
+        response = await client.post(f"{BASE_URL}/query/", json=payload, timeout=120.0)
+        response.raise_for_status()
+        return time.perf_counter() - start
+
+    async def run() -> tuple[float, float]:
+        async with httpx.AsyncClient() as client:
+            # Sequential baseline, then the same two queries at once
+            sequential = await timed_query(client) + await timed_query(client)
+            start = time.perf_counter()
+            await asyncio.gather(timed_query(client), timed_query(client))
+            return sequential, time.perf_counter() - start
+
+    sequential, concurrent = asyncio.run(run())
+    print(f"Sequential: {sequential:.2f}s, concurrent: {concurrent:.2f}s")
+    # If the event loop were blocked, the concurrent pair would take as long as the sequential pair
+    assert concurrent < 0.75 * sequential, "Concurrent queries did not overlap in time"
+    print()
+
+
 def test_query_stream():
     """Test the streaming query endpoint via SSE."""
     print("Testing /query/stream endpoint...")
@@ -68,6 +106,104 @@ def test_ingest():
     print(f"Response: {response.json()}\n")
 
 
+def test_ingest_job():
+    """Test the background ingestion job endpoints."""
+    print("Testing /ingest/background and /ingest/jobs/{id}...")
+    response = httpx.post(
+        f"{BASE_URL}/ingest/background",
+        json={"file_extensions": [".txt", ".md"]},
+    )
+    print(f"Status: {response.status_code}")
+    assert response.status_code == 202, response.text
+    job_id = response.json()["job_id"]
+
+    # A second job for the same collection is rejected while the first is unfinished
+    conflict = httpx.post(f"{BASE_URL}/ingest/background", json={})
+    print(f"Concurrent submit status: {conflict.status_code}")
+    # So is a synchronous ingest of the same collection
+    sync_conflict = httpx.post(f"{BASE_URL}/ingest/", json={}, timeout=120.0)
+    print(f"Concurrent sync ingest status: {sync_conflict.status_code}")
+
+    for _ in range(120):
+        job = httpx.get(f"{BASE_URL}/ingest/jobs/{job_id}").json()
+        print(f"  {job['status']}: {job['files_done']}/{job['files_total']} files, ETA {job['eta_seconds']}")
+        if job["status"] not in ("queued", "running"):
+            break
+        time.sleep(1)
+    print(f"Final job: {job}\n")
+    assert job["status"] == "succeeded", job
+
+
+def test_palaces_stream_failure():
+    """Test that a palace that fails to analyze still completes the palace stream."""
+    print("Testing /ziwei/analyze-palaces/stream with a malformed palace...")
+    payload = {
+        "birthInfo": {
+            "gender": "female",
+            "birthYear": 1990,
+            "birthMonth": 5,
+            "birthDay": 12,
+            "birthShichen": "chen",
+        },
+        "astrolabe": {
+            "palaces": [
+                {"name": "命宫", "majorStars": [{"name": "紫微"}], "decadal": {"range": [3, 12]}},
+                {"name": "兄弟", "majorStars": [{"name": "天机"}], "decadal": "bad"},
+            ]
+        },
+        "bypassCache": True,
+    }
+    events: list[tuple[str, str]] = []
+    with httpx.stream(
+        "POST", f"{BASE_URL}/ziwei/analyze-palaces/stream", json=payload, timeout=120.0
+    ) as response:
+        print(f"Status: {response.status_code}")
+        event = ""
+        for line in response.iter_lines():
+            if line.startswith("event:"):
+                event = line[6:].strip()
+            elif line.startswith("data:") and event != "token":
+                events.append((event, line[5:].strip()))
+                print(f"  {event}: {line[5:].strip()[:80]}")
+    assert [event for event, _ in events].count("palace") == 2, events
+    assert events[-1][0] == "done", events
+    print()
+
+
+def test_trace():
+    """Test that a query's spans can be inspected by its trace ID."""
+    print("Testing request tracing...")
+    response = httpx.post(
+        f"{BASE_URL}/query/",
+        json={"prompt": "What is RAG?", "top_k": 3},
+        timeout=60.0,
+    )
+    trace_id = response.headers["X-Trace-Id"]
+    print(f"Trace ID: {trace_id}")
+
+    trace = httpx.get(f"{BASE_URL}/debug/traces/{trace_id}").json()
+    print(f"Trace took {trace['duration_ms']:.1f}ms")
+    for span in trace["spans"]:
+        print(f"  {span['name']}: {span['duration_ms']:.1f}ms {span['attributes']}")
+    names = {span["name"] for span in trace["spans"]}
+    assert {"rag.retrieve", "rag.build_prompt", "llm.chat"} <= names, names
+    print()
+
+
+def test_metrics():
+    """Test the Prometheus metrics endpoint after the queries above."""
+    print("Testing metrics endpoint...")
+    response = httpx.get(f"{BASE_URL}/metrics")
+    print(f"Status: {response.status_code}")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    for line in response.text.splitlines():
+        if line.startswith("xuan_stage_duration_seconds_count") or line.startswith("xuan_llm_"):
+            print(f"  {line}")
+    assert 'xuan_stage_duration_seconds_count{stage="rag_retrieve"}' in response.text
+    print()
+
+
 if __name__ == "__main__":
     print("=" * 50)
     print("RAG API Test Script")
@@ -79,8 +215,23 @@ if __name__ == "__main__":
     # Ingest documents before querying
     test_ingest()
 
+    # Test background ingestion jobs
+    test_ingest_job()
+
     # Test sync query
     test_query_sync()
 
+    # Test that queries overlap in time
+    test_query_concurrent()
+
     # Test streaming query
     test_query_stream()
+
+    # Test that a failing palace does not stall the palace stream
+    test_palaces_stream_failure()
+
+    # Test tracing of a query
+    test_trace()
+
+    # Test metrics recorded by the queries above
+    test_metrics()